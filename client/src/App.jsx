@@ -159,7 +159,7 @@ You can type your question or select a topic below to get started!`
       // Check for hearing-related condition
       else if (matchesKeyword(userMsg, "hearingRelated")) {
         setSpecialNeeds("hearing impairment");
-        followUp = "Thank you for sharing. Since you mentioned hearing impairment or deafness, you might find the audio summary feature helpful. You can insert audio files under 25 MB and transcribe the video into text.";
+        followUp = "Thank you for sharing. Since you mentioned hearing impairment or deafness, you might find the audio summary feature helpful. You can upload audio recordings and transcribe them into text.";
       }
       // Check for adhd/dyslexia
       else if (matchesKeyword(userMsg, "summary")) {
@@ -414,7 +414,13 @@ You can type your question or select a topic below to get started!`
         body: formData,
       });
 
-      const data = await res.json();
+      let data = await res.json();
+      // The backend queues the audio as a job; poll until the minutes are ready
+      while (data.job_id && (data.status === "queued" || data.status === "running")) {
+        await new Promise((resolve) => setTimeout(resolve, 2000));
+        const jobRes = await fetch(`${API_BASE_URL}/audio-jobs/${data.job_id}/result`);
+        data = await jobRes.json();
+      }
       console.log("API Response:", data); // Debugging log
 
       if (data.error) {
@@ -621,7 +627,7 @@ You can type your question or select a topic below to get started!`
           {minutesLoading ? 'Transcribing...' : 'Transcribe Audio'}
         </button>
         <button
-          onClick={() => window.open(`${API_BASE_URL}/download-audio-docx`, '_blank')}
+          onClick={() => window.open(`${API_BASE_URL}/download-audio-docx/${minutes.job_id}`, '_blank')}
           disabled={minutesLoading || !minutes || minutes.error}
           style={{ width: 200, height: 70 }}
         >
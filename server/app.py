@@ -1,75 +1,211 @@
 import os
 import io
-import re
-import pdfplumber
-import openai
+import sys
+import json
+import hashlib
+import shutil
+import tempfile
+import time
+import atexit
+import queue
+import logging
+import contextvars
 
-from flask import Flask, request, jsonify, send_file
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import product
+from collections import deque, namedtuple
+from logging.handlers import QueueHandler, QueueListener
+from flask import Flask, Response, g, request, jsonify, send_file, stream_with_context
 from flask_cors import CORS
-from openai import OpenAI
 from docx import Document
 from dotenv import load_dotenv
+from retrieval import build_index, select_context
+from padlet_cache import PadletCache, file_fingerprint
+from redaction import DEFAULT_NAMES_TO_REDACT, Redactor, StreamRedactor, load_names
+from audio import AudioSplitError, WHISPER_MAX_BYTES, needs_splitting, split_audio, split_transcript, stitch_transcripts
+from jobs import JobError, JobQueue
+from artifacts import ArtifactStore
+from tts_cache import AudioCache, split_sentences
+from response_cache import ResponseCache
+from ingest import padlet_files, extract_padlet_files
+from history import compact_history
+from prescreen import is_benign
+from upstream import CircuitBreaker, Upstream, UpstreamUnavailable, pooled_client
+from knowledge_base import KnowledgeBase, PadletSnapshot, content_version, folder_signature
+from metrics import (
+    CACHE_REQUESTS, CHAT_INTENTS, CONTENT_TYPE, HTTP_REQUESTS, HTTP_SECONDS, REGISTRY,
+    log_event, observe_stage, record_tokens, start_timings, timed
+)
 
 
 app = Flask(__name__)
 CORS(app, origins="*")
 
 load_dotenv()  # Load environment variables from .env file
+# Records are written out by a background thread, so request threads never wait on log I/O
+LOG_QUEUE = queue.SimpleQueue()
+log_handler = logging.StreamHandler()
+log_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+# Queued records carry only the message (and traceback); log_handler adds the rest
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'), handlers=[QueueHandler(LOG_QUEUE)], format='%(message)s')
+LOG_LISTENER = QueueListener(LOG_QUEUE, log_handler)
+logger = logging.getLogger('chatbot')
+# Under the spawn start method every ingestion pool process first re-runs the parent's main script as
+# __mp_main__ (in the server process that name is only an alias of __main__). When that script is this
+# server (`python app.py`, or `python asgi_app.py`, which imports this module) the copy only extracts PDF
+# pages, so start_services() is skipped.
+SPAWNED_COPY = getattr(sys.modules.get('__mp_main__'), '__name__', None) == '__mp_main__'
 API_KEY = os.getenv('OPENAI_API_KEY')
 PADLET_CONTENT = os.getenv('PADLET_CONTENT')
-client = OpenAI(api_key=API_KEY)
+PADLET_CACHE_DIR = os.getenv('PADLET_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache'))
+PADLET_WATCH_INTERVAL = float(os.getenv('PADLET_WATCH_INTERVAL', 30))
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+REDACT_NAMES_FILE = os.getenv('REDACT_NAMES_FILE')
+PADLET_INGEST_WORKERS = int(os.getenv('PADLET_INGEST_WORKERS', os.cpu_count() or 1))
+
+# Distress classification runs alongside the main completion. With DISTRESS_PRESCREEN=true, greetings and
+# plain FAQ/logistics questions (see prescreen.py) skip it; everything else is always classified
+DISTRESS_PRESCREEN = os.getenv('DISTRESS_PRESCREEN', 'false').lower() == 'true'
+DISTRESS_PRESCREEN_MAX_WORDS = int(os.getenv('DISTRESS_PRESCREEN_MAX_WORDS', 40))
+# Meeting minutes: 'parallel' runs the four extractions concurrently, 'structured' asks for all four in one JSON completion
+MINUTES_MODE = os.getenv('MINUTES_MODE', 'parallel').lower()
+MINUTES_TIMEOUT = float(os.getenv('MINUTES_TIMEOUT', 120))
+# Transcripts longer than this are summarised map-reduce style, one chunk at a time
+MINUTES_CHUNK_TOKENS = int(os.getenv('MINUTES_CHUNK_TOKENS', 6000))
+MINUTES_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.getenv('MINUTES_MAX_WORKERS', 4)), thread_name_prefix='minutes')
+# Long recordings are cut into overlapping segments and transcribed concurrently
+MAX_AUDIO_UPLOAD_MB = int(os.getenv('MAX_AUDIO_UPLOAD_MB', 500))
+AUDIO_SEGMENT_SECONDS = int(os.getenv('AUDIO_SEGMENT_SECONDS', 600))
+AUDIO_OVERLAP_SECONDS = int(os.getenv('AUDIO_OVERLAP_SECONDS', 5))
+TRANSCRIBE_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.getenv('TRANSCRIBE_MAX_WORKERS', 4)), thread_name_prefix='transcribe')
+# /upload-audio only queues the work; a local pool processes it and clients poll for the result
+AUDIO_JOBS_DIR = os.getenv('AUDIO_JOBS_DIR', os.path.join(tempfile.gettempdir(), 'audio_jobs'))
+AUDIO_JOB_WORKERS = int(os.getenv('AUDIO_JOB_WORKERS', 2))
+# Generated DOCX minutes are kept in memory per job and rebuilt from the stored result if evicted
+DOCX_CACHE_TTL = float(os.getenv('DOCX_CACHE_TTL', 3600))
+DOCX_ARTIFACTS = ArtifactStore(
+    max_bytes=int(os.getenv('DOCX_CACHE_MB', 64)) * 1024 * 1024,
+    ttl=DOCX_CACHE_TTL
+)
+# Transcripts and minutes are personal data: finished jobs are deleted after this many seconds
+AUDIO_JOB_RETENTION = float(os.getenv('AUDIO_JOB_RETENTION', DOCX_CACHE_TTL))
+DOCX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+# Synthesized speech is cached on disk by hash of (text, voice, model)
+TTS_MODEL = os.getenv('TTS_MODEL', 'tts-1')  # or "tts-1-hd"
+TTS_VOICE = os.getenv('TTS_VOICE', 'alloy')  # or "nova", "shimmer", "echo", etc.
+TTS_CACHE_DIR = os.getenv('TTS_CACHE_DIR', os.path.join(PADLET_CACHE_DIR, 'tts'))
+TTS_CACHE_BYTES = int(os.getenv('TTS_CACHE_MB', 256)) * 1024 * 1024
+TTS_PIPELINE_DEPTH = int(os.getenv('TTS_PIPELINE_DEPTH', 3))
+TTS_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.getenv('TTS_MAX_WORKERS', 8)), thread_name_prefix='tts')
+# Answers to repeated (or near-identical) first questions are reused until the corpus changes
+RESPONSE_CACHE = ResponseCache(
+    max_entries=int(os.getenv('RESPONSE_CACHE_SIZE', 512)),
+    ttl=float(os.getenv('RESPONSE_CACHE_TTL', 3600)),
+    threshold=float(os.getenv('RESPONSE_CACHE_SIMILARITY', 0.9))
+)
+CHAT_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.getenv('CHAT_PIPELINE_WORKERS', 16)), thread_name_prefix='chat')
+
+# Conversation history sent upstream is capped at HISTORY_TOKEN_BUDGET tokens; older turns are
+# dropped, or summarized with HISTORY_COMPACTION=summarize
+HISTORY_TOKEN_BUDGET = int(os.getenv('HISTORY_TOKEN_BUDGET', 3000))
+HISTORY_KEEP_MESSAGES = int(os.getenv('HISTORY_KEEP_MESSAGES', 6))
+HISTORY_COMPACTION = os.getenv('HISTORY_COMPACTION', 'drop').lower()
+
+# Every OpenAI call goes through UPSTREAM: one connection pool, per-endpoint timeouts (seconds),
+# jittered retries, a cap on calls in flight and a circuit breaker shared by all endpoints
+UPSTREAM_MAX_CONCURRENCY = int(os.getenv('UPSTREAM_MAX_CONCURRENCY', 32))
+client = pooled_client(API_KEY, max_connections=UPSTREAM_MAX_CONCURRENCY)
+UPSTREAM = Upstream(
+    client,
+    timeouts={
+        'chat': float(os.getenv('UPSTREAM_CHAT_TIMEOUT', 30)),
+        'classify': float(os.getenv('UPSTREAM_CLASSIFY_TIMEOUT', 10)),
+        'summary': float(os.getenv('UPSTREAM_SUMMARY_TIMEOUT', 20)),
+        'minutes': MINUTES_TIMEOUT,
+        'transcribe': float(os.getenv('UPSTREAM_TRANSCRIBE_TIMEOUT', 300)),
+        'speech': float(os.getenv('UPSTREAM_SPEECH_TIMEOUT', 30))
+    },
+    max_concurrency=UPSTREAM_MAX_CONCURRENCY,
+    queue_timeout=float(os.getenv('UPSTREAM_QUEUE_TIMEOUT', 10)),
+    retries=int(os.getenv('UPSTREAM_RETRIES', 2)),
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.getenv('UPSTREAM_BREAKER_FAILURES', 5)),
+        reset_after=float(os.getenv('UPSTREAM_BREAKER_RESET', 30))
+    )
+)
+REGISTRY.gauge(
+    'chatbot_upstream_circuit_open', "1 while the upstream circuit breaker is rejecting calls",
+    lambda: {(): int(UPSTREAM.breaker.state == 'open')}
+)
+# Sent instead of an answer while the OpenAI API is unreachable
+UPSTREAM_FALLBACK_REPLY = (
+    "Sorry, I'm unable to answer right now. Please try again in a few minutes, "
+    "or contact nyp_sns@nyp.edu.sg for further assistance."
+)
+
+# Retrieval settings: RETRIEVAL_TOP_K=0 injects the whole corpus like before
+RETRIEVAL_TOP_K = int(os.getenv('RETRIEVAL_TOP_K', 6))
+RETRIEVAL_TOKEN_BUDGET = int(os.getenv('RETRIEVAL_TOKEN_BUDGET', 1500))
+RETRIEVAL_CHUNK_TOKENS = int(os.getenv('RETRIEVAL_CHUNK_TOKENS', 200))
+
+def load_padlet_documents(folder=PADLET_CONTENT):
+    files = padlet_files(folder)
+    texts = extract_padlet_files([os.path.join(folder, fname) for fname, _ in files], PADLET_INGEST_WORKERS)
+    return [(title, text) for (_, title), (text, _) in zip(files, texts)]
+
+def join_padlet_documents(documents):
+    return "".join(f"\n--- {title} ---\n{text}" for title, text in documents)
 
 def load_padlet_content(folder=PADLET_CONTENT):
-    combined = ""
-    # Read all .txt files
-    for fname in os.listdir(folder):
-        if fname.lower().endswith('.txt'):
-            with open(os.path.join(folder, fname), 'r', encoding='utf-8') as f:
-                combined += f"\n--- {fname.replace('_', ' ').replace('.txt','').title()} ---\n"
-                combined += f.read() + "\n"
-    # Read all .pdf files
-    for fname in os.listdir(folder):
-        if fname.lower().endswith('.pdf'):
-            with pdfplumber.open(os.path.join(folder, fname)) as pdf:
-                combined += f"\n--- {fname} ---\n"
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        combined += page_text + "\n"
-    return combined
+    return join_padlet_documents(load_padlet_documents(folder))
 
+REDACTOR = Redactor(load_names(REDACT_NAMES_FILE) if REDACT_NAMES_FILE else DEFAULT_NAMES_TO_REDACT)
+# Cached redactions are refreshed whenever the compiled rules (including the name list) change
+REDACTION_VERSION = REDACTOR.version
+
+@timed('redaction')
 def redact_sensitive_info(text):
-    # Redact emails except nyp_sns@nyp.edu.sg
-    text = re.sub(
-        r'\b(?!nyp_sns@nyp\.edu\.sg\b)[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b',
-        '[REDACTED EMAIL]',
-        text
-    )
-    # Redact Singapore phone numbers (8 digits, starting with 6, 8, or 9)
-    text = re.sub(r'\b[689]\d{7}\b', '[REDACTED PHONE]', text)
-    # Redact generic phone numbers (8+ digits)
-    text = re.sub(r'\b\d{8,}\b', '[REDACTED PHONE]', text)
-    # Optionally redact ages (e.g., "Age: 21")
-    text = re.sub(r'Age: ?\d+', 'Age: [REDACTED]', text)
-    NAMES_TO_REDACT = [
-        "Audrey Wai", "John Tan", "Marcus Lee", "Jessie Tang", "Liew Tian En",
-        "Ng Su Li", "Soh Lay Hong", "Megane Wong", "Khoo Kiah Hong", "Chai Kuek Heng",
-        "Akram", "Ridzuan", "Kah Wee", "Al", "Dloysius", "Nurul Assyakirin Izzati", "Sasha"
-    ]
-    for name in NAMES_TO_REDACT:
-        pattern = re.compile(r'\b' + re.escape(name) + r'\b', re.IGNORECASE)
-        text = pattern.sub('[REDACTED NAME]', text)
-    return text
+    return REDACTOR.redact(text)
+
+def ingest_padlet_documents(folder=PADLET_CONTENT, cache=None):
+    # Returns (raw_documents, redacted_documents), only re-parsing files whose contents changed
+    files = padlet_files(folder)
+    paths = [os.path.join(folder, fname) for fname, _ in files]
+    fingerprints = [file_fingerprint(path) for path in paths]
+    entries = [cache.get(fp, REDACTION_VERSION, redact_sensitive_info) if cache else None for fp in fingerprints]
 
+    # Parse every cache miss in one parallel batch
+    misses = [i for i, entry in enumerate(entries) if entry is None]
+    start = time.perf_counter()
+    extracted = extract_padlet_files([paths[i] for i in misses], PADLET_INGEST_WORKERS)
+    for i, (raw, elapsed) in zip(misses, extracted):
+        entries[i] = (raw, redact_sensitive_info(raw))
+        if cache:
+            cache.put(fingerprints[i], raw, entries[i][1], REDACTION_VERSION)
+        logger.info("Parsed %s (%d bytes) in %.3fs", files[i][0], fingerprints[i].size, elapsed)
+    if misses:
+        logger.info("Parsed %d padlet file(s) in %.3fs wall time", len(misses), time.perf_counter() - start)
+    if cache:
+        cache.prune(folder, paths)
+
+    raw_documents = [(title, entry[0]) for (_, title), entry in zip(files, entries)]
+    redacted_documents = [(title, entry[1]) for (_, title), entry in zip(files, entries)]
+    return raw_documents, redacted_documents
+
+# Memoized per flag combination. Additions are ordered from most to least stable (session-level
+# condition/refusal/simplify before the per-message intent) so consecutive requests share the
+# longest possible prompt prefix, which upstream prompt caching can reuse.
+@lru_cache(maxsize=256)
 def build_system_prompt(distressed, obsessed, escalated, special_needs, refused_condition, simplify):
-    system_prompt = """
+    system_prompt = f"""
     You are a Nanyang Polytechnic Special Needs Consultant (not a student).
     Answer questions as if you are consulting a Nanyang Polytechnic student.
     Base your answers strictly on the information provided:
     
     The chatbot supports the following features:
     - Voice mode: Users can interact with the chatbot using speech recognition. Users can also press the Ctrl + Spacebar buttons at the same time to turn on the microphone without using the mouse to interact with the screen.
-    - Audio transcription: Users can upload audio files (under 25 MB) to transcribe them into text.
+    - Audio transcription: Users can upload audio files (up to {MAX_AUDIO_UPLOAD_MB} MB) to transcribe them into text.
     - Audio summary download: After transcribing audio, users can download a summary in DOCX format.
     
     Never reveal sensitive information of any staff member, alumni or student mentioned inside. For example email addresses, phone numbers, or any other personal information.
@@ -82,6 +218,33 @@ def build_system_prompt(distressed, obsessed, escalated, special_needs, refused_
     
     Never answer as a student. Always answer as the consultant.
     """
+    if special_needs:
+        system_prompt += f"\nThe student has shared their special needs condition: {special_needs}."
+        if special_needs == "visual":
+            system_prompt += (
+                "\nIMPORTANT: The student has a visual impairment or blindness. "
+                "Remind them they can use voice mode by pressing Ctrl + Spacebar to turn on the microphone."
+            )
+        elif special_needs == "hearing":
+            system_prompt += (
+                "\nIMPORTANT: The student has a hearing impairment or deafness. "
+                "Recommend them to use the audio transcriber if they have any audio clips that they want to understand."
+            )
+        elif special_needs in ["adhd", "dyslexia"]:
+            simplify = True
+            system_prompt += (
+                "\nIMPORTANT: The student has ADHD or dyslexia. "
+                "Summarise your answers in point form or numbered lists, and keep responses under 75 words."
+            )
+    if refused_condition:
+        system_prompt += "\nThe student has chosen not to share their special needs condition."
+    if simplify:
+        system_prompt += (
+            "\nIMPORTANT: Your response MUST be in point form or a numbered list."
+            " Do NOT write paragraphs. Do NOT exceed 75 words."
+            " If you cannot answer in under 75 words, summarize only the most important points."
+            " Do not include any extra explanation or introduction."
+        )
     if distressed:
         system_prompt += (
             """
@@ -117,37 +280,12 @@ def build_system_prompt(distressed, obsessed, escalated, special_needs, refused_
             Please note that this is an AI chat bot, and there is no staff attending to this chat bot.
             """
         )
-    if special_needs:
-        system_prompt += f"\nThe student has shared their special needs condition: {special_needs}."
-        if special_needs == "visual":
-            system_prompt += (
-                "\nIMPORTANT: The student has a visual impairment or blindness. "
-                "Remind them they can use voice mode by pressing Ctrl + Spacebar to turn on the microphone."
-            )
-        elif special_needs == "hearing":
-            system_prompt += (
-                "\nIMPORTANT: The student has a hearing impairment or deafness. "
-                "Recommend them to use the audio transcriber if they have any audio clips that they want to understand."
-            )
-        elif special_needs in ["adhd", "dyslexia"]:
-            simplify = True
-            system_prompt += (
-                "\nIMPORTANT: The student has ADHD or dyslexia. "
-                "Summarise your answers in point form or numbered lists, and keep responses under 75 words."
-            )
-    if refused_condition:
-        system_prompt += "\nThe student has chosen not to share their special needs condition."
-    if simplify:
-        system_prompt += (
-            "\nIMPORTANT: Your response MUST be in point form or a numbered list."
-            " Do NOT write paragraphs. Do NOT exceed 75 words."
-            " If you cannot answer in under 75 words, summarize only the most important points."
-            " Do not include any extra explanation or introduction."
-        )
     return system_prompt
 
-def detect_distress_intent(message):
-    response = client.chat.completions.create(
+def distress_intent_request(message):
+    # Keyword arguments for the classifier call, shared with the async server
+    return dict(
+        endpoint='classify',
         model="gpt-3.5-turbo",
         temperature=0,
         messages=[
@@ -164,8 +302,13 @@ def detect_distress_intent(message):
             {"role": "user", "content": message}
         ]
     )
+
+@timed('distress_classification')
+def detect_distress_intent(message):
+    response = UPSTREAM.chat(**distress_intent_request(message))
     return response.choices[0].message.content.strip().lower()
 
+@timed('condition_detection')
 def detect_condition(message):
     message_lower = message.lower()
     # Prioritize sight > hearing > adhd > dyslexia
@@ -179,40 +322,133 @@ def detect_condition(message):
         return "dyslexia"
     return None
 
+def prescreen_intent(message):
+    # 'safe' for greetings and plain FAQ/logistics questions, None when the remote classifier has to decide
+    if DISTRESS_PRESCREEN and is_benign(message, DISTRESS_PRESCREEN_MAX_WORDS):
+        return 'safe'
+    return None
+
 def transcribe_audio(audio_file_path):
+    # Read up front so a retried upload sends the whole file again
     with open(audio_file_path, 'rb') as audio_file:
-        response = client.audio.transcriptions.create(
-            model="whisper-1", 
-            file=audio_file
-        )
+        audio = (os.path.basename(audio_file_path), audio_file.read())
+    response = UPSTREAM.transcribe(
+        model="whisper-1",
+        file=audio
+    )
     return response.text
 
+@timed('transcription')
+def transcribe_long_audio(audio_file_path):
+    if not needs_splitting(audio_file_path, AUDIO_SEGMENT_SECONDS):
+        return transcribe_audio(audio_file_path)
+    workdir = tempfile.mkdtemp(prefix='segments_')
+    try:
+        segments = split_audio(audio_file_path, workdir, AUDIO_SEGMENT_SECONDS, AUDIO_OVERLAP_SECONDS)
+        texts = list(TRANSCRIBE_EXECUTOR.map(transcribe_audio, segments))
+        return stitch_transcripts(texts)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+MINUTES_FALLBACKS = {
+    'abstract_summary': "Unable to create a summary of the provided content.",
+    'key_points': "No key points were extracted from the content.",
+    'action_items': "No action items were identified in the content.",
+    'sentiment': "Unable to deduce sentiment of audio clip"
+}
+
+def clean_minutes_section(key, value):
+    if isinstance(value, list):
+        value = "\n".join(f"- {item}" for item in value)
+    if not value:
+        return MINUTES_FALLBACKS[key]
+    if key != 'action_items' and ("I'm here to help" in value or "Could you please" in value):
+        return MINUTES_FALLBACKS[key]
+    return value
+
+@timed('minutes')
 def meeting_minutes(transcription):
-    abstract_summary = abstract_summary_extraction(transcription)
-    if "I'm here to help" in abstract_summary or "Could you please" in abstract_summary:
-        abstract_summary = "Unable to create a summary of the provided content."
-        
-    key_points = key_points_extraction(transcription)
-    if "I'm here to help" in key_points or "Could you please" in key_points:
-        key_points = "No key points were extracted from the content."
-        
-    action_items = action_item_extraction(transcription)
-    if not action_items:
-        action_items = "No action items were identified in the content."
-        
-    sentiment = sentiment_analysis(transcription)
-    if "I'm here to help" in sentiment or "Could you please" in sentiment:
-        sentiment = "Unable to deduce sentiment of audio clip"
-        
-    return {
-        'abstract_summary': abstract_summary,
-        'key_points': key_points,
-        'action_items': action_items,
-        'sentiment': sentiment
+    chunks = split_transcript(transcription, MINUTES_CHUNK_TOKENS)
+    if MINUTES_MODE == 'structured' and len(chunks) == 1:
+        minutes = structured_minutes_extraction(transcription)
+        if minutes is not None:
+            return minutes
+
+    extractions = {
+        'abstract_summary': abstract_summary_extraction,
+        'key_points': key_points_extraction,
+        'action_items': action_item_extraction,
+        'sentiment': sentiment_analysis
     }
-    
+    # Map: every extraction over every transcript chunk, all at once
+    futures = {
+        key: [MINUTES_EXECUTOR.submit(contextvars.copy_context().run, extract, chunk) for chunk in chunks]
+        for key, extract in extractions.items()
+    }
+    partials = {}
+    for key, chunk_futures in futures.items():
+        partials[key] = []
+        for future in chunk_futures:
+            # A failed or timed-out extraction falls back to its default text; the others still come back
+            try:
+                partials[key].append(future.result())
+            except Exception as e:
+                logger.warning("Extracting %s failed: %s", key, e)
+
+    # Reduce: run the same extraction over the per-chunk results
+    if len(chunks) > 1:
+        futures = {
+            key: MINUTES_EXECUTOR.submit(contextvars.copy_context().run, extractions[key], "\n\n".join(results))
+            for key, results in partials.items() if results
+        }
+        for key in partials:
+            try:
+                partials[key] = [futures[key].result()] if key in futures else []
+            except Exception as e:
+                logger.warning("Combining %s failed: %s", key, e)
+                partials[key] = []
+
+    return {key: clean_minutes_section(key, results[0] if results else None) for key, results in partials.items()}
+
+@timed('extraction_structured')
+def structured_minutes_extraction(transcription):
+    try:
+        response = UPSTREAM.chat(
+            endpoint='minutes',
+            model="gpt-3.5-turbo",
+            temperature=0,
+            response_format={"type": "json_object"},
+            messages=[
+                {
+                    "role": "system",
+                    "content": (
+                        "You are a highly skilled AI trained in language comprehension, summarization and emotion analysis. "
+                        "Read the following text and respond with a JSON object with exactly these string fields: "
+                        "'abstract_summary': a concise abstract paragraph retaining the most important points; "
+                        "'key_points': the main points, ideas, findings or topics discussed, one per line; "
+                        "'action_items': the tasks, assignments or actions agreed upon or mentioned as needing to be done, one per line; "
+                        "'sentiment': whether the overall sentiment is positive, negative or neutral, with a brief explanation. "
+                        "If a field cannot be determined, use an empty string for it. "
+                        "Avoid conversational or empathetic language. Provide only factual and direct responses."
+                    )
+                },
+                {
+                    "role": "user",
+                    "content": transcription
+                }
+            ]
+        )
+        result = json.loads(response.choices[0].message.content)
+    except Exception as e:
+        # Fall back to one extraction per section
+        logger.warning("Structured minutes extraction failed: %s", e)
+        return None
+    return {key: clean_minutes_section(key, result.get(key)) for key in MINUTES_FALLBACKS}
+
+@timed('extraction_abstract_summary')
 def abstract_summary_extraction(transcription):
-    response = client.chat.completions.create(
+    response = UPSTREAM.chat(
+        endpoint='minutes',
         model="gpt-3.5-turbo",
         temperature=0,
         messages=[
@@ -236,8 +472,10 @@ def abstract_summary_extraction(transcription):
     )
     return response.choices[0].message.content  
 
+@timed('extraction_key_points')
 def key_points_extraction(transcription):
-    response = client.chat.completions.create(
+    response = UPSTREAM.chat(
+        endpoint='minutes',
         model="gpt-3.5-turbo",
         temperature=0,
         messages=[
@@ -260,8 +498,10 @@ def key_points_extraction(transcription):
     )
     return response.choices[0].message.content
 
+@timed('extraction_action_items')
 def action_item_extraction(transcription):
-    response = client.chat.completions.create(
+    response = UPSTREAM.chat(
+        endpoint='minutes',
         model="gpt-3.5-turbo",
         temperature=0,
         messages=[
@@ -284,8 +524,10 @@ def action_item_extraction(transcription):
     )
     return response.choices[0].message.content
  
+@timed('extraction_sentiment')
 def sentiment_analysis(transcription):
-    response = client.chat.completions.create(
+    response = UPSTREAM.chat(
+        endpoint='minutes',
         model="gpt-3.5-turbo",
         temperature=0,
         messages=[
@@ -307,7 +549,8 @@ def sentiment_analysis(transcription):
     )
     return response.choices[0].message.content
 
-def save_as_docx(minutes, filename, transcript=None):
+@timed('docx_build')
+def save_as_docx(minutes, transcript=None):
     doc = Document()
     for key, value in minutes.items():
         # Replace underscores with spaces and capitalize each word for the heading
@@ -321,14 +564,176 @@ def save_as_docx(minutes, filename, transcript=None):
         doc.add_heading('Full Transcript', level=1)
         doc.add_paragraph(transcript)
         doc.add_paragraph()
-    doc.save(filename)
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
 
-PADLET_RAW_CONTENT = load_padlet_content()
-PADLET_REDACTED_CONTENT = redact_sensitive_info(PADLET_RAW_CONTENT)
+@timed('padlet_load')
+def load_padlet_snapshot(folder=PADLET_CONTENT):
+    # Take the signature first so edits made mid-ingestion are picked up by the next check
+    signature = folder_signature(folder)
+    raw_documents, redacted_documents = ingest_padlet_documents(folder, cache=PADLET_CACHE)
+    return PadletSnapshot(
+        version=content_version(redacted_documents),
+        signature=signature,
+        raw_documents=raw_documents,
+        redacted_documents=redacted_documents,
+        raw_content=join_padlet_documents(raw_documents),
+        redacted_content=join_padlet_documents(redacted_documents),
+        index=build_index(redacted_documents, RETRIEVAL_CHUNK_TOKENS)
+    )
 
-@app.route('/chat', methods=['POST'])
-def chat():
-    data = request.get_json()
+@timed('retrieval')
+def padlet_context(snapshot, query):
+    if RETRIEVAL_TOP_K <= 0:
+        return snapshot.redacted_content
+    return select_context(snapshot.index, query, RETRIEVAL_TOP_K, RETRIEVAL_TOKEN_BUDGET)
+
+ChatRequest = namedtuple('ChatRequest', [
+    'user_messages', 'last_user_message', 'special_needs', 'refused_condition', 'simplify', 'voice_mode', 'context',
+    'corpus_version', 'history', 'history_usage'
+])
+
+# Blocks are (role, content) tuples; they are aligned to the start of the conversation,
+# so each earlier block is summarized once and reused on every later turn
+@lru_cache(maxsize=256)
+def summarize_history_block(block):
+    transcript = "\n".join(f"{role}: {content}" for role, content in block)
+    response = UPSTREAM.chat(
+        endpoint='summary',
+        model="gpt-3.5-turbo",
+        temperature=0,
+        messages=[
+            {
+                "role": "system",
+                "content": "Summarise this earlier part of a conversation between a student and a support chatbot in a few sentences. "
+                           "Keep any facts, names of services and questions that later replies may depend on."
+            },
+            {"role": "user", "content": transcript}
+        ]
+    )
+    return response.choices[0].message.content
+
+def summarize_history(messages):
+    return summarize_history_block(tuple((msg['role'], msg.get('content') or '') for msg in messages))
+
+@timed('history_compaction')
+def chat_history(user_messages):
+    # System messages from the client are never forwarded; the server builds its own
+    messages = [msg for msg in user_messages if msg['role'] != 'system']
+    summarize = summarize_history if HISTORY_COMPACTION == 'summarize' else None
+    try:
+        return compact_history(messages, HISTORY_TOKEN_BUDGET, HISTORY_KEEP_MESSAGES, summarize=summarize)
+    except Exception as e:
+        # A failed summary should not fail the chat; plain dropping always fits
+        logger.warning("Summarizing history failed: %s", e)
+        return compact_history(messages, HISTORY_TOKEN_BUDGET, HISTORY_KEEP_MESSAGES)
+
+def process_audio_job(job_id, audio_path, filename):
+    timings = start_timings()
+    try:
+        # Transcribe and generate minutes
+        transcription = redact_sensitive_info(transcribe_long_audio(audio_path))
+    except AudioSplitError:
+        raise JobError(f'Files over {WHISPER_MAX_BYTES // (1024 * 1024)} MB can only be processed as .wav on this server.')
+    except UpstreamUnavailable as e:
+        logger.warning("Upstream unavailable: %s", e)
+        raise JobError('The transcription service is unavailable right now. Please try again later.')
+    minutes = meeting_minutes(transcription)
+
+    # Build the document with transcript for this job only
+    DOCX_ARTIFACTS.put(job_id, save_as_docx(minutes, transcript=transcription))
+    log_event(logger, 'audio_job', timings, job_id=job_id, transcript_chars=len(transcription))
+
+    # Include the transcript in the result
+    return {**minutes, 'transcript': transcription}
+
+def warm_system_prompts():
+    # Precompute every combination of the standard flags (one intent at a time)
+    intents = [(False, False, False), (True, False, False), (False, True, False), (False, False, True)]
+    conditions = [None, "visual", "hearing", "adhd", "dyslexia"]
+    for intent, special_needs, refused_condition, simplify in product(intents, conditions, [False, True], [False, True]):
+        build_system_prompt(*intent, special_needs, refused_condition, simplify)
+
+# The padlet context goes last so everything before it stays a stable prefix. With RETRIEVAL_TOP_K=0 the
+# context is the snapshot's whole corpus, so each flag combination is assembled once per corpus version.
+@lru_cache(maxsize=64)
+def assemble_system_prompt(system_prompt, context):
+    return "".join([system_prompt, "\n\nHere is all the information you must use to answer questions:\n", context])
+
+@timed('prompt_build')
+def chat_completion_request(system_prompt, context, history, stream=False):
+    full_system_prompt = assemble_system_prompt(system_prompt, context)
+    options = {"stream_options": {"include_usage": True}} if stream else {}
+    return dict(
+        model="gpt-3.5-turbo",
+        messages=[
+            {"role": "system", "content": full_system_prompt},
+        ] + history,
+        stream=stream,
+        **options
+    )
+
+def complete_chat(system_prompt, context, history, stream=False):
+    request_args = chat_completion_request(system_prompt, context, history, stream)
+    if stream:
+        # The caller times the completion while it reads the stream
+        return UPSTREAM.chat(**request_args)
+    with timed('completion'):
+        return UPSTREAM.chat(**request_args)
+
+def chat_usage(chat_request, response=None, cached=False):
+    # Token usage reported by the API for this answer (zero when it came from the response cache
+    # or the fallback reply), plus how the conversation history was compacted
+    usage = getattr(response, 'usage', None)
+    return {
+        'prompt_tokens': getattr(usage, 'prompt_tokens', 0) or 0,
+        'completion_tokens': getattr(usage, 'completion_tokens', 0) or 0,
+        'total_tokens': getattr(usage, 'total_tokens', 0) or 0,
+        'cached': cached,
+        **chat_request.history_usage
+    }
+
+def start_services():
+    # Everything that touches disk, starts threads or ingests the corpus, once per server process
+    global PADLET_CACHE, TTS_CACHE, KNOWLEDGE_BASE, AUDIO_JOBS
+    LOG_LISTENER.start()
+    atexit.register(LOG_LISTENER.stop)
+    PADLET_CACHE = PadletCache(PADLET_CACHE_DIR)
+    TTS_CACHE = AudioCache(TTS_CACHE_DIR, TTS_CACHE_BYTES)
+    KNOWLEDGE_BASE = KnowledgeBase(PADLET_CONTENT, load_padlet_snapshot)
+    KNOWLEDGE_BASE.start_watcher(PADLET_WATCH_INTERVAL)
+    warm_system_prompts()
+    AUDIO_JOBS = JobQueue(AUDIO_JOBS_DIR, process_audio_job, AUDIO_JOB_WORKERS, retention=AUDIO_JOB_RETENTION)
+    AUDIO_JOBS.resume()
+    AUDIO_JOBS.start_pruner()
+
+PADLET_CACHE = TTS_CACHE = KNOWLEDGE_BASE = AUDIO_JOBS = None
+if not SPAWNED_COPY:
+    start_services()
+
+@app.before_request
+def start_request_metrics():
+    g.started = time.perf_counter()
+    # Stage timings recorded while serving this request, for its structured log line
+    g.timings = start_timings()
+
+@app.after_request
+def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    HTTP_REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+    HTTP_SECONDS.observe(time.perf_counter() - g.started, route=route)
+    return response
+
+# Prometheus scrape endpoint (this process's counters only)
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+def prepare_chat(data):
+    # Request fields shared by /chat and /chat/stream
+    # Pin one corpus snapshot for the whole request, even if a reload swaps it mid-way
+    snapshot = KNOWLEDGE_BASE.current()
     user_messages = data.get('messages', [])
     special_needs = data.get('specialNeeds')
     refused_condition = data.get('refusedCondition')
@@ -345,102 +750,354 @@ def chat():
         detected_condition = detect_condition(last_user_message)
         if detected_condition:
             special_needs = detected_condition
-            print(f"Detected {special_needs}")
 
-    intent = detect_distress_intent(last_user_message)
+    history, history_usage = chat_history(user_messages)
+    return ChatRequest(
+        user_messages=user_messages,
+        last_user_message=last_user_message,
+        special_needs=special_needs,
+        refused_condition=refused_condition,
+        simplify=simplify,
+        voice_mode=voice_mode,
+        context=padlet_context(snapshot, last_user_message),
+        corpus_version=snapshot.version,
+        history=history,
+        history_usage=history_usage
+    )
 
+INTENT_LABELS = ('safe', 'distressed', 'obsessed', 'harmful')
+
+def chat_flags(chat_request, intent):
     distressed = intent == 'distressed'
     obsessed = intent == 'obsessed'
     escalated = intent == 'harmful'
+    # The classifier's reply is free text: keep the metric's label set bounded and log anything unexpected
+    if intent not in INTENT_LABELS:
+        logger.warning("Unexpected distress classification %r", intent)
+    CHAT_INTENTS.inc(intent=intent if intent in INTENT_LABELS else 'other')
+    return distressed, obsessed, escalated
 
-    auto_simplify = simplify or (special_needs in ["adhd", "dyslexia"])
-    
-    print(f"AI intent detection: {intent}")
-    print(f"distressed: {distressed}")
-    print(f"obsessed: {obsessed}")
-    print(f"escalated: {escalated}")
-    print(f"special_needs: {special_needs}")
-    print(f"refused_condition: {refused_condition}")
-    print(f"simplify: {simplify}")
-    
-    system_prompt = build_system_prompt(distressed, obsessed, escalated, special_needs, refused_condition, simplify)
-    full_system_prompt = system_prompt + "\n\nHere is all the information you must use to answer questions:\n" + PADLET_REDACTED_CONTENT
-    
-    # print(full_system_prompt)
+def normalized_special_needs(chat_request):
+    # Clients may send any JSON value; the memoized prompt builder and the response cache need a hashable one
+    special_needs = chat_request.special_needs
+    if special_needs is not None and not isinstance(special_needs, str):
+        special_needs = str(special_needs)
+    return special_needs
+
+def chat_system_prompt(chat_request, distressed=False, obsessed=False, escalated=False):
+    return build_system_prompt(
+        distressed, obsessed, escalated,
+        normalized_special_needs(chat_request), bool(chat_request.refused_condition), bool(chat_request.simplify)
+    )
 
+def response_cache_flags(chat_request, intent):
+    # The parts of the system prompt an answer depends on, or None when it must not be reused
+    if sum(1 for msg in chat_request.user_messages if msg['role'] == 'user') != 1:
+        # Follow-up questions depend on the earlier turns
+        return None
+    if intent in ('distressed', 'obsessed'):
+        # These answers are meant to be personal and varied
+        return None
+    return (
+        'harmful' if intent == 'harmful' else 'safe',
+        normalized_special_needs(chat_request), bool(chat_request.refused_condition), bool(chat_request.simplify)
+    )
+
+def cached_answer(chat_request, cache_flags):
+    if not cache_flags:
+        return None
+    answer = RESPONSE_CACHE.get(chat_request.last_user_message, cache_flags, chat_request.corpus_version)
+    CACHE_REQUESTS.inc(cache='response', result='miss' if answer is None else 'hit')
+    return answer
+
+def log_chat(chat_request, intent, usage, timings, stream=False, degraded=False):
+    # One structured line per answered chat, in place of the old per-flag prints
+    log_event(
+        logger, 'chat', timings,
+        stream=stream,
+        intent=intent,
+        special_needs=chat_request.special_needs,
+        refused_condition=bool(chat_request.refused_condition),
+        simplify=bool(chat_request.simplify),
+        degraded=degraded,
+        **usage
+    )
+
+def chat_metadata(chat_request):
+    return {
+        'tts': chat_request.voice_mode or (chat_request.special_needs == "visual"),
+        'simplify': chat_request.simplify or (chat_request.special_needs in ["adhd", "dyslexia"]),
+        'specialNeeds': chat_request.special_needs
+    }
+
+@app.route('/chat', methods=['POST'])
+def chat():
+    timings = g.timings
+    chat_request = prepare_chat(request.get_json())
+    message = chat_request.last_user_message
+
+    intent = None
+    answer_future = None
+    answer = None
+    checked_flags = None
     try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": full_system_prompt},
-            ] + [msg for msg in user_messages if msg['role'] != 'system']
-        )
-        tts_enabled = voice_mode or (special_needs == "visual")
-        auto_simplify = simplify or (special_needs in ["adhd", "dyslexia"])
+        intent = prescreen_intent(message)
+        if intent is None:
+            # Classify and speculatively answer as 'safe' at the same time (in this request's timing context),
+            # unless the cache already has the 'safe' answer
+            intent_future = CHAT_EXECUTOR.submit(contextvars.copy_context().run, detect_distress_intent, message)
+            checked_flags = response_cache_flags(chat_request, 'safe')
+            answer = cached_answer(chat_request, checked_flags)
+            # Only speculate while the circuit is closed: a half-open breaker admits a single trial call,
+            # which has to be the classifier's, and a speculative call cannot be recalled once it has started
+            if answer is None and UPSTREAM.breaker.state == 'closed':
+                answer_future = CHAT_EXECUTOR.submit(
+                    contextvars.copy_context().run,
+                    complete_chat, chat_system_prompt(chat_request), chat_request.context, chat_request.history
+                )
+            intent = intent_future.result()
+
+        distressed, obsessed, escalated = chat_flags(chat_request, intent)
+        cache_flags = response_cache_flags(chat_request, intent)
+        if cache_flags != checked_flags:
+            # The 'safe' lookup does not apply to this intent
+            answer = cached_answer(chat_request, cache_flags)
+        response = None
+        if answer is not None:
+            if answer_future is not None:
+                answer_future.cancel()
+        else:
+            if answer_future is not None and not (distressed or obsessed or escalated):
+                response = answer_future.result()
+            else:
+                if answer_future is not None:
+                    # The speculative answer used the wrong flags; discard it and ask again
+                    answer_future.cancel()
+                system_prompt = chat_system_prompt(chat_request, distressed, obsessed, escalated)
+                response = complete_chat(system_prompt, chat_request.context, chat_request.history)
+            answer = redact_sensitive_info(response.choices[0].message.content)
+            if cache_flags:
+                RESPONSE_CACHE.put(message, cache_flags, chat_request.corpus_version, answer)
+
+        usage = chat_usage(chat_request, response, cached=response is None)
+        log_chat(chat_request, intent, usage, timings)
         return jsonify({
-            'response': response.choices[0].message.content,
-            'tts': tts_enabled,
-            'simplify': auto_simplify,
-            'specialNeeds': special_needs
+            'response': answer,
+            **chat_metadata(chat_request),
+            'usage': usage
         })
-    except Exception as e:
-        print("Error:", str(e))
+    except UpstreamUnavailable as e:
+        # Degrade to a canned reply rather than an error while the API is down or saturated
+        logger.warning("Upstream unavailable: %s", e)
+        if answer_future is not None:
+            answer_future.cancel()
+        usage = chat_usage(chat_request)
+        log_chat(chat_request, intent, usage, timings, degraded=True)
+        return jsonify({
+            'response': UPSTREAM_FALLBACK_REPLY,
+            **chat_metadata(chat_request),
+            'usage': usage
+        })
+    except Exception:
+        logger.exception("Chat request failed")
+        if answer_future is not None:
+            answer_future.cancel()
         return jsonify({'error': 'An error occurred while processing your request.'}), 500
 
-@app.route('/upload-audio', methods=['POST'])
-def upload_audio():
-    if 'file' not in request.files:
-        return jsonify({'error': 'No file part'}), 400
-    
-    audio_file = request.files['file']
+def sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+# Same request body as /chat, answered as Server-Sent Events:
+# 'meta' (tts/simplify/specialNeeds) first, then 'token' events, then 'done' with token usage (or 'error')
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    timings = g.timings
+    chat_request = prepare_chat(request.get_json())
+    intent = None
+    try:
+        # Streamed tokens cannot be taken back, so the flags must be known before the first one
+        intent = prescreen_intent(chat_request.last_user_message) or detect_distress_intent(chat_request.last_user_message)
+        flags = chat_flags(chat_request, intent)
+        cache_flags = response_cache_flags(chat_request, intent)
+        cached = cached_answer(chat_request, cache_flags)
+        reply = cached
+        if cached is None:
+            completion_started = time.perf_counter()
+            stream = complete_chat(chat_system_prompt(chat_request, *flags), chat_request.context, chat_request.history, stream=True)
+    except UpstreamUnavailable as e:
+        logger.warning("Upstream unavailable: %s", e)
+        cached, reply = None, UPSTREAM_FALLBACK_REPLY
+    except Exception:
+        logger.exception("Chat stream request failed")
+        return jsonify({'error': 'An error occurred while processing your request.'}), 500
+
+    def generate():
+        yield sse_event('meta', chat_metadata(chat_request))
+        if reply is not None:
+            usage = chat_usage(chat_request, cached=cached is not None)
+            log_chat(chat_request, intent, usage, timings, stream=True, degraded=cached is None)
+            yield sse_event('token', {'content': reply})
+            yield sse_event('done', {'usage': usage})
+            return
+        redactor = StreamRedactor(REDACTOR)
+        parts = []
+        final_chunk = None
+        try:
+            for chunk in stream:
+                if not chunk.choices:
+                    # With include_usage the last chunk carries the token counts and no choices
+                    final_chunk = chunk
+                    continue
+                text = redactor.feed(chunk.choices[0].delta.content or "")
+                if text:
+                    if not parts:
+                        observe_stage('first_token', time.perf_counter() - completion_started, timings)
+                    parts.append(text)
+                    yield sse_event('token', {'content': text})
+            text = redactor.flush()
+            if text:
+                parts.append(text)
+                yield sse_event('token', {'content': text})
+            observe_stage('completion', time.perf_counter() - completion_started, timings)
+            record_tokens('chat', getattr(final_chunk, 'usage', None))
+            if cache_flags:
+                RESPONSE_CACHE.put(chat_request.last_user_message, cache_flags, chat_request.corpus_version, "".join(parts))
+            usage = chat_usage(chat_request, final_chunk or stream)
+            log_chat(chat_request, intent, usage, timings, stream=True)
+            yield sse_event('done', {'usage': usage})
+        except Exception:
+            logger.exception("Chat stream failed")
+            yield sse_event('error', {'error': 'An error occurred while processing your request.'})
+        finally:
+            # Also runs when the client disconnects (GeneratorExit): stop reading from the API
+            stream.close()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# Re-ingest padlet_content in the background (only changed files are re-parsed)
+@app.route('/admin/reload-padlet', methods=['POST'])
+def reload_padlet():
+    if not ADMIN_TOKEN or request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+        return jsonify({'error': 'Forbidden'}), 403
+    started = KNOWLEDGE_BASE.reload_in_background()
+    return jsonify({
+        'status': 'reloading' if started else 'reload already in progress',
+        'version': KNOWLEDGE_BASE.current().version
+    }), 202
+
+def audio_upload_error(audio_file):
+    # (error payload, status) for an unacceptable upload, None when it can be queued
     if audio_file.filename == '':
-        return jsonify({'error': 'No selected file'}), 400
+        return {'error': 'No selected file'}, 400
     
     # Check file extension
     allowed_extensions = {'wav', 'mp3', 'mp4', 'm4a'}
     ext = audio_file.filename.rsplit('.', 1)[-1].lower()
     if ext not in allowed_extensions:
-        return jsonify({'error': f'Unsupported file format: .{ext}. Allowed formats: {", ".join(allowed_extensions)}'}), 400
+        return {'error': f'Unsupported file format: .{ext}. Allowed formats: {", ".join(allowed_extensions)}'}, 400
     
-    max_file_size = 25 * 1024 * 1024
+    max_file_size = MAX_AUDIO_UPLOAD_MB * 1024 * 1024
     audio_file.seek(0, os.SEEK_END)  # Move the cursor to the end of the file
     file_size = audio_file.tell()  # Get the file size
     audio_file.seek(0)  # Reset the cursor to the beginning of the file
 
     if file_size > max_file_size:
-        return jsonify({
-            'error': f'File size exceeds the 25 MB limit. The uploaded file is {file_size / (1024 * 1024):.2f} MB.'
-        }), 413
-        
-    # Save the file temporarily
-    temp_path = f"/tmp/{audio_file.filename}"
-    audio_file.save(temp_path)
+        return {
+            'error': f'File size exceeds the {MAX_AUDIO_UPLOAD_MB} MB limit. The uploaded file is {file_size / (1024 * 1024):.2f} MB.'
+        }, 413
+    return None
 
-    try:
-        # Transcribe and generate minutes
-        transcription = transcribe_audio(temp_path)
-        minutes = meeting_minutes(transcription)
-        
-        # Save the file with transcript
-        save_as_docx(minutes, '/tmp/audio.docx', transcript=transcription)
+def queue_audio_upload(audio_file):
+    # Save the upload while hashing it, so re-uploading the same audio finds the existing job
+    ext = audio_file.filename.rsplit('.', 1)[-1].lower()
+    fd, temp_path = tempfile.mkstemp(prefix='upload_', suffix=f'.{ext}', dir=AUDIO_JOBS_DIR)
+    digest = hashlib.sha256()
+    with os.fdopen(fd, 'wb') as f:
+        for block in iter(lambda: audio_file.stream.read(1024 * 1024), b''):
+            digest.update(block)
+            f.write(block)
+
+    job, _ = AUDIO_JOBS.submit(temp_path, audio_file.filename, digest.hexdigest())
+    return job
+
+@app.route('/upload-audio', methods=['POST'])
+def upload_audio():
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file part'}), 400
     
-        # Include the transcript in the response
-        return jsonify({**minutes, 'transcript': transcription})
-    except Exception as e:
-        print("Error:", str(e))  # Debugging log
-        return jsonify({'error': 'An error occurred while processing the audio file.'}), 500
-    finally:
-        # Clean up the temporary file
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+    audio_file = request.files['file']
+    error = audio_upload_error(audio_file)
+    if error is not None:
+        return jsonify(error[0]), error[1]
+
+    return jsonify(queue_audio_upload(audio_file)), 202
+
+@app.route('/audio-jobs/<job_id>', methods=['GET'])
+def audio_job_status(job_id):
+    job = AUDIO_JOBS.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@app.route('/audio-jobs/<job_id>/result', methods=['GET'])
+def audio_job_result(job_id):
+    job = AUDIO_JOBS.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job['status'] == 'failed':
+        return jsonify(job), 500
+    if job['status'] != 'done':
+        return jsonify(job), 202
+    return jsonify({**AUDIO_JOBS.result(job_id), 'job_id': job_id})
+
+def docx_artifact(job_id):
+    if AUDIO_JOBS.get(job_id) is None:
+        # Unknown, or past AUDIO_JOB_RETENTION: the minutes must not outlive the job
+        DOCX_ARTIFACTS.discard(job_id)
+        return None
+    data = DOCX_ARTIFACTS.get(job_id)
+    CACHE_REQUESTS.inc(cache='docx', result='miss' if data is None else 'hit')
+    if data is None:
+        # Evicted, or built by another worker process: rebuild from the stored job result
+        result = AUDIO_JOBS.result(job_id)
+        if result is None:
+            return None
+        transcript = result.pop('transcript', None)
+        data = save_as_docx(result, transcript=transcript)
+        DOCX_ARTIFACTS.put(job_id, data)
+    return data
 
 # Download audio transcript endpoint
 @app.route('/download-audio-docx', methods=['GET'])
-def download_audio_docx():
-    docx_path = '/tmp/audio.docx'
-    if not os.path.exists(docx_path):
+@app.route('/download-audio-docx/<job_id>', methods=['GET'])
+def download_audio_docx(job_id=None):
+    job_id = job_id or request.args.get('id')
+    if not job_id:
+        return jsonify({'error': 'No document id provided'}), 400
+    data = docx_artifact(job_id)
+    if data is None:
         return jsonify({'error': 'No document found'}), 404
-    return send_file(docx_path, as_attachment=True)
+    return send_file(io.BytesIO(data), mimetype=DOCX_MIMETYPE, as_attachment=True, download_name='audio.docx')
+
+@timed('tts_synthesis')
+def synthesize_speech(text, voice=TTS_VOICE, model=TTS_MODEL):
+    key = TTS_CACHE.key(text, voice, model)
+    audio_bytes = TTS_CACHE.get(key)
+    CACHE_REQUESTS.inc(cache='tts', result='miss' if audio_bytes is None else 'hit')
+    if audio_bytes is None:
+        # Call OpenAI TTS API
+        response = UPSTREAM.speech(
+            model=model,
+            voice=voice,
+            input=text
+        )
+        audio_bytes = response.content
+        TTS_CACHE.put(key, audio_bytes)
+    return audio_bytes
 
 @app.route('/tts', methods=['POST'])
 def tts():
@@ -449,13 +1106,11 @@ def tts():
     if not text:
         return jsonify({'error': 'No text provided'}), 400
 
-    # Call OpenAI TTS API
-    response = openai.audio.speech.create(
-        model="tts-1",  # or "tts-1-hd"
-        voice="alloy",   # or "nova", "shimmer", "echo", etc.
-        input=text
-    )
-    audio_bytes = response.content
+    try:
+        audio_bytes = synthesize_speech(text)
+    except UpstreamUnavailable as e:
+        logger.warning("Upstream unavailable: %s", e)
+        return jsonify({'error': 'Text-to-speech is unavailable right now.'}), 503
 
     # Return as a file-like object
     return send_file(
@@ -465,5 +1120,36 @@ def tts():
         download_name='speech.mp3'
     )
 
+# Sentence-by-sentence TTS: each sentence is synthesized (or read from the cache) in a pipeline
+# and its MP3 frames are streamed as soon as it and everything before it are ready
+@app.route('/tts/stream', methods=['POST'])
+def tts_stream():
+    data = request.get_json()
+    text = data.get('text', '')
+    if not text:
+        return jsonify({'error': 'No text provided'}), 400
+    sentences = split_sentences(text)
+
+    def generate():
+        pending = deque()
+        remaining = iter(sentences)
+        for sentence in remaining:
+            pending.append(TTS_EXECUTOR.submit(contextvars.copy_context().run, synthesize_speech, sentence))
+            if len(pending) >= TTS_PIPELINE_DEPTH:
+                break
+        try:
+            while pending:
+                audio_bytes = pending.popleft().result()
+                sentence = next(remaining, None)
+                if sentence is not None:
+                    pending.append(TTS_EXECUTOR.submit(contextvars.copy_context().run, synthesize_speech, sentence))
+                yield audio_bytes
+        finally:
+            # Client went away or a sentence failed: don't synthesize the rest
+            for future in pending:
+                future.cancel()
+
+    return Response(stream_with_context(generate()), mimetype='audio/mpeg', headers={'Cache-Control': 'no-cache'})
+
 if __name__ == '__main__':
     app.run(host='127.0.0.1', port=3000, debug=True)
\ No newline at end of file
@@ -0,0 +1,55 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ArtifactStore:
+    # In-memory LRU of generated files (e.g. DOCX minutes) keyed by job id, bounded by total bytes and age
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=3600):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        while self._items:
+            key, (data, stored_at) = next(iter(self._items.items()))
+            if self._size <= self.max_bytes and now - stored_at <= self.ttl:
+                # Oldest-used entry is fresh and we are under budget; entries are not TTL-ordered,
+                # so expired ones further in are dropped lazily by get()
+                break
+            del self._items[key]
+            self._size -= len(data)
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return False
+        now = time.time()
+        with self._lock:
+            if key in self._items:
+                self._size -= len(self._items.pop(key)[0])
+            self._items[key] = (data, now)
+            self._size += len(data)
+            self._evict(now)
+        return True
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            data, stored_at = item
+            if now - stored_at > self.ttl:
+                del self._items[key]
+                self._size -= len(data)
+                return None
+            self._items.move_to_end(key)
+            return data
+
+    def discard(self, key):
+        with self._lock:
+            item = self._items.pop(key, None)
+            if item is not None:
+                self._size -= len(item[0])
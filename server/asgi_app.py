@@ -0,0 +1,334 @@
+# Async serving mode: the same routes and JSON contracts as app.py, served from an event loop with the
+# async OpenAI client, so one process can hold hundreds of chats that are mostly waiting on the API.
+# Run with: hypercorn asgi_app:app --bind 0.0.0.0:3000
+import asyncio
+import io
+import os
+import time
+from collections import deque
+
+from quart import Quart, Response, g, request, jsonify, send_file
+from quart_cors import cors
+from app import (
+    ADMIN_TOKEN, API_KEY, AUDIO_JOBS, DOCX_MIMETYPE, KNOWLEDGE_BASE, MAX_AUDIO_UPLOAD_MB, REDACTOR, RESPONSE_CACHE,
+    TTS_CACHE, TTS_MODEL, TTS_PIPELINE_DEPTH, TTS_VOICE, UPSTREAM, UPSTREAM_FALLBACK_REPLY, logger,
+    audio_upload_error, cached_answer, chat_completion_request, chat_flags, chat_metadata, chat_system_prompt,
+    chat_usage, distress_intent_request, docx_artifact, log_chat, prepare_chat, prescreen_intent, queue_audio_upload,
+    redact_sensitive_info, response_cache_flags, sse_event
+)
+from metrics import (
+    CACHE_REQUESTS, CONTENT_TYPE, HTTP_REQUESTS, HTTP_SECONDS, REGISTRY,
+    observe_stage, record_tokens, start_timings, timed
+)
+from redaction import StreamRedactor
+from tts_cache import split_sentences
+from upstream import AsyncUpstream, UpstreamUnavailable, pooled_async_client
+
+
+app = cors(Quart(__name__), allow_origin="*")
+# Leave room for the multipart overhead around the largest accepted recording
+app.config['MAX_CONTENT_LENGTH'] = (MAX_AUDIO_UPLOAD_MB + 1) * 1024 * 1024
+app.config['BODY_TIMEOUT'] = float(os.getenv('ASGI_BODY_TIMEOUT', 600))
+# Upstream calls carry their own timeouts; long TTS streams must not be cut off
+app.config['RESPONSE_TIMEOUT'] = None
+
+# Shares the sync gateway's timeouts, retry policy and circuit breaker (audio jobs still use the sync client)
+ASYNC_UPSTREAM_MAX_CONCURRENCY = int(os.getenv('ASYNC_UPSTREAM_MAX_CONCURRENCY', 256))
+ASYNC_UPSTREAM = AsyncUpstream(
+    pooled_async_client(API_KEY, max_connections=ASYNC_UPSTREAM_MAX_CONCURRENCY),
+    UPSTREAM.timeouts,
+    max_concurrency=ASYNC_UPSTREAM_MAX_CONCURRENCY,
+    queue_timeout=UPSTREAM.queue_timeout,
+    retries=UPSTREAM.retries,
+    breaker=UPSTREAM.breaker
+)
+
+async def detect_distress_intent(message):
+    with timed('distress_classification'):
+        response = await ASYNC_UPSTREAM.chat(**distress_intent_request(message))
+    return response.choices[0].message.content.strip().lower()
+
+async def complete_chat(system_prompt, context, history, stream=False):
+    request_args = chat_completion_request(system_prompt, context, history, stream)
+    if stream:
+        # The caller times the completion while it reads the stream
+        return await ASYNC_UPSTREAM.chat(**request_args)
+    with timed('completion'):
+        return await ASYNC_UPSTREAM.chat(**request_args)
+
+@app.before_request
+async def start_request_metrics():
+    g.started = time.perf_counter()
+    # Shared with the tasks and threads this request starts, which run in copies of its context
+    g.timings = start_timings()
+
+@app.after_request
+async def record_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    HTTP_REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+    HTTP_SECONDS.observe(time.perf_counter() - g.started, route=route)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+async def chat_request_from_body():
+    # Retrieval and history compaction are CPU work (and summaries use the sync client): keep them off the loop
+    return await asyncio.to_thread(prepare_chat, await request.get_json())
+
+@app.route('/chat', methods=['POST'])
+async def chat():
+    timings = g.timings
+    chat_request = await chat_request_from_body()
+    message = chat_request.last_user_message
+
+    intent = None
+    answer_task = None
+    answer = None
+    checked_flags = None
+    try:
+        intent = prescreen_intent(message)
+        if intent is None:
+            # Classify and speculatively answer as 'safe' at the same time, unless the cache already
+            # has the 'safe' answer
+            intent_task = asyncio.ensure_future(detect_distress_intent(message))
+            checked_flags = response_cache_flags(chat_request, 'safe')
+            answer = cached_answer(chat_request, checked_flags)
+            # Only speculate while the circuit is closed: a half-open breaker admits a single trial call,
+            # which has to be the classifier's, and a speculative call cannot be recalled once it has started
+            if answer is None and ASYNC_UPSTREAM.breaker.state == 'closed':
+                answer_task = asyncio.ensure_future(
+                    complete_chat(chat_system_prompt(chat_request), chat_request.context, chat_request.history)
+                )
+            intent = await intent_task
+
+        distressed, obsessed, escalated = chat_flags(chat_request, intent)
+        cache_flags = response_cache_flags(chat_request, intent)
+        if cache_flags != checked_flags:
+            # The 'safe' lookup does not apply to this intent
+            answer = cached_answer(chat_request, cache_flags)
+        response = None
+        if answer is not None:
+            if answer_task is not None:
+                answer_task.cancel()
+        else:
+            if answer_task is not None and not (distressed or obsessed or escalated):
+                response = await answer_task
+            else:
+                if answer_task is not None:
+                    # The speculative answer used the wrong flags; discard it and ask again
+                    answer_task.cancel()
+                system_prompt = chat_system_prompt(chat_request, distressed, obsessed, escalated)
+                response = await complete_chat(system_prompt, chat_request.context, chat_request.history)
+            answer = redact_sensitive_info(response.choices[0].message.content)
+            if cache_flags:
+                RESPONSE_CACHE.put(message, cache_flags, chat_request.corpus_version, answer)
+
+        usage = chat_usage(chat_request, response, cached=response is None)
+        log_chat(chat_request, intent, usage, timings)
+        return jsonify({
+            'response': answer,
+            **chat_metadata(chat_request),
+            'usage': usage
+        })
+    except UpstreamUnavailable as e:
+        logger.warning("Upstream unavailable: %s", e)
+        if answer_task is not None:
+            answer_task.cancel()
+        usage = chat_usage(chat_request)
+        log_chat(chat_request, intent, usage, timings, degraded=True)
+        return jsonify({
+            'response': UPSTREAM_FALLBACK_REPLY,
+            **chat_metadata(chat_request),
+            'usage': usage
+        })
+    except Exception:
+        logger.exception("Chat request failed")
+        if answer_task is not None:
+            answer_task.cancel()
+        return jsonify({'error': 'An error occurred while processing your request.'}), 500
+
+@app.route('/chat/stream', methods=['POST'])
+async def chat_stream():
+    timings = g.timings
+    chat_request = await chat_request_from_body()
+    intent = None
+    try:
+        # Streamed tokens cannot be taken back, so the flags must be known before the first one
+        intent = prescreen_intent(chat_request.last_user_message) or await detect_distress_intent(chat_request.last_user_message)
+        flags = chat_flags(chat_request, intent)
+        cache_flags = response_cache_flags(chat_request, intent)
+        cached = cached_answer(chat_request, cache_flags)
+        reply = cached
+        if cached is None:
+            completion_started = time.perf_counter()
+            stream = await complete_chat(chat_system_prompt(chat_request, *flags), chat_request.context, chat_request.history, stream=True)
+    except UpstreamUnavailable as e:
+        logger.warning("Upstream unavailable: %s", e)
+        cached, reply = None, UPSTREAM_FALLBACK_REPLY
+    except Exception:
+        logger.exception("Chat stream request failed")
+        return jsonify({'error': 'An error occurred while processing your request.'}), 500
+
+    async def generate():
+        yield sse_event('meta', chat_metadata(chat_request))
+        if reply is not None:
+            usage = chat_usage(chat_request, cached=cached is not None)
+            log_chat(chat_request, intent, usage, timings, stream=True, degraded=cached is None)
+            yield sse_event('token', {'content': reply})
+            yield sse_event('done', {'usage': usage})
+            return
+        redactor = StreamRedactor(REDACTOR)
+        parts = []
+        final_chunk = None
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    # With include_usage the last chunk carries the token counts and no choices
+                    final_chunk = chunk
+                    continue
+                text = redactor.feed(chunk.choices[0].delta.content or "")
+                if text:
+                    if not parts:
+                        observe_stage('first_token', time.perf_counter() - completion_started, timings)
+                    parts.append(text)
+                    yield sse_event('token', {'content': text})
+            text = redactor.flush()
+            if text:
+                parts.append(text)
+                yield sse_event('token', {'content': text})
+            observe_stage('completion', time.perf_counter() - completion_started, timings)
+            record_tokens('chat', getattr(final_chunk, 'usage', None))
+            if cache_flags:
+                RESPONSE_CACHE.put(chat_request.last_user_message, cache_flags, chat_request.corpus_version, "".join(parts))
+            usage = chat_usage(chat_request, final_chunk or stream)
+            log_chat(chat_request, intent, usage, timings, stream=True)
+            yield sse_event('done', {'usage': usage})
+        except Exception:
+            logger.exception("Chat stream failed")
+            yield sse_event('error', {'error': 'An error occurred while processing your request.'})
+        finally:
+            # Also runs when the client disconnects: stop reading from the API
+            await stream.close()
+
+    return Response(
+        generate(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/admin/reload-padlet', methods=['POST'])
+async def reload_padlet():
+    if not ADMIN_TOKEN or request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+        return jsonify({'error': 'Forbidden'}), 403
+    started = KNOWLEDGE_BASE.reload_in_background()
+    return jsonify({
+        'status': 'reloading' if started else 'reload already in progress',
+        'version': KNOWLEDGE_BASE.current().version
+    }), 202
+
+@app.route('/upload-audio', methods=['POST'])
+async def upload_audio():
+    files = await request.files
+    if 'file' not in files:
+        return jsonify({'error': 'No file part'}), 400
+
+    audio_file = files['file']
+    error = audio_upload_error(audio_file)
+    if error is not None:
+        return jsonify(error[0]), error[1]
+
+    # Hashing, the disk copy and the job database are blocking work
+    return jsonify(await asyncio.to_thread(queue_audio_upload, audio_file)), 202
+
+@app.route('/audio-jobs/<job_id>', methods=['GET'])
+async def audio_job_status(job_id):
+    job = await asyncio.to_thread(AUDIO_JOBS.get, job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@app.route('/audio-jobs/<job_id>/result', methods=['GET'])
+async def audio_job_result(job_id):
+    job = await asyncio.to_thread(AUDIO_JOBS.get, job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job['status'] == 'failed':
+        return jsonify(job), 500
+    if job['status'] != 'done':
+        return jsonify(job), 202
+    return jsonify({**await asyncio.to_thread(AUDIO_JOBS.result, job_id), 'job_id': job_id})
+
+@app.route('/download-audio-docx', methods=['GET'])
+@app.route('/download-audio-docx/<job_id>', methods=['GET'])
+async def download_audio_docx(job_id=None):
+    job_id = job_id or request.args.get('id')
+    if not job_id:
+        return jsonify({'error': 'No document id provided'}), 400
+    data = await asyncio.to_thread(docx_artifact, job_id)
+    if data is None:
+        return jsonify({'error': 'No document found'}), 404
+    return await send_file(io.BytesIO(data), mimetype=DOCX_MIMETYPE, as_attachment=True, attachment_filename='audio.docx')
+
+async def synthesize_speech(text, voice=TTS_VOICE, model=TTS_MODEL):
+    with timed('tts_synthesis'):
+        key = TTS_CACHE.key(text, voice, model)
+        audio_bytes = await asyncio.to_thread(TTS_CACHE.get, key)
+        CACHE_REQUESTS.inc(cache='tts', result='miss' if audio_bytes is None else 'hit')
+        if audio_bytes is None:
+            response = await ASYNC_UPSTREAM.speech(
+                model=model,
+                voice=voice,
+                input=text
+            )
+            audio_bytes = response.content
+            await asyncio.to_thread(TTS_CACHE.put, key, audio_bytes)
+    return audio_bytes
+
+@app.route('/tts', methods=['POST'])
+async def tts():
+    data = await request.get_json()
+    text = data.get('text', '')
+    if not text:
+        return jsonify({'error': 'No text provided'}), 400
+
+    try:
+        audio_bytes = await synthesize_speech(text)
+    except UpstreamUnavailable as e:
+        logger.warning("Upstream unavailable: %s", e)
+        return jsonify({'error': 'Text-to-speech is unavailable right now.'}), 503
+
+    return await send_file(io.BytesIO(audio_bytes), mimetype='audio/mpeg', attachment_filename='speech.mp3')
+
+@app.route('/tts/stream', methods=['POST'])
+async def tts_stream():
+    data = await request.get_json()
+    text = data.get('text', '')
+    if not text:
+        return jsonify({'error': 'No text provided'}), 400
+    sentences = split_sentences(text)
+
+    async def generate():
+        pending = deque()
+        remaining = iter(sentences)
+        for sentence in remaining:
+            pending.append(asyncio.ensure_future(synthesize_speech(sentence)))
+            if len(pending) >= TTS_PIPELINE_DEPTH:
+                break
+        try:
+            while pending:
+                audio_bytes = await pending.popleft()
+                sentence = next(remaining, None)
+                if sentence is not None:
+                    pending.append(asyncio.ensure_future(synthesize_speech(sentence)))
+                yield audio_bytes
+        finally:
+            # Client went away or a sentence failed: don't synthesize the rest
+            for task in pending:
+                task.cancel()
+
+    return Response(generate(), mimetype='audio/mpeg', headers={'Cache-Control': 'no-cache'})
+
+if __name__ == '__main__':
+    app.run(host='127.0.0.1', port=3000, debug=True)
@@ -0,0 +1,136 @@
+import os
+import re
+import shutil
+import subprocess
+import wave
+
+from tokens import count_tokens
+
+WHISPER_MAX_BYTES = 25 * 1024 * 1024
+
+
+class AudioSplitError(Exception):
+    pass
+
+
+def ffmpeg_available():
+    return shutil.which('ffmpeg') is not None and shutil.which('ffprobe') is not None
+
+def audio_duration(path):
+    if ffmpeg_available():
+        result = subprocess.run(
+            ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'default=nw=1:nk=1', path],
+            capture_output=True, text=True, check=True
+        )
+        return float(result.stdout.strip())
+    try:
+        with wave.open(path, 'rb') as wav:
+            return wav.getnframes() / wav.getframerate()
+    except (wave.Error, EOFError) as e:
+        raise AudioSplitError(f"Cannot read audio duration without ffmpeg: {e}")
+
+def segment_bounds(duration, segment_seconds, overlap_seconds):
+    # Overlapping windows so words cut at a boundary appear whole in one of the two segments
+    step = max(segment_seconds - overlap_seconds, 1)
+    bounds = []
+    start = 0.0
+    while start < duration:
+        bounds.append((start, min(start + segment_seconds, duration)))
+        if start + segment_seconds >= duration:
+            break
+        start += step
+    return bounds
+
+def _split_with_ffmpeg(path, bounds, workdir):
+    paths = []
+    for i, (start, end) in enumerate(bounds):
+        out = os.path.join(workdir, f"segment_{i:04d}.mp3")
+        # Mono 16 kHz 48 kbps keeps a 10 minute segment around 3.5 MB, well under Whisper's limit
+        subprocess.run(
+            ['ffmpeg', '-v', 'error', '-y', '-ss', f"{start:.3f}", '-t', f"{end - start:.3f}", '-i', path,
+             '-vn', '-ac', '1', '-ar', '16000', '-b:a', '48k', out],
+            check=True
+        )
+        paths.append(out)
+    return paths
+
+def _split_wav(path, bounds, workdir):
+    paths = []
+    with wave.open(path, 'rb') as wav:
+        params = wav.getparams()
+        for i, (start, end) in enumerate(bounds):
+            out = os.path.join(workdir, f"segment_{i:04d}.wav")
+            wav.setpos(int(start * params.framerate))
+            frames = wav.readframes(int((end - start) * params.framerate))
+            with wave.open(out, 'wb') as segment:
+                segment.setparams(params)
+                segment.writeframes(frames)
+            paths.append(out)
+    return paths
+
+def split_audio(path, workdir, segment_seconds=600, overlap_seconds=5):
+    duration = audio_duration(path)
+    if ffmpeg_available():
+        return _split_with_ffmpeg(path, segment_bounds(duration, segment_seconds, overlap_seconds), workdir)
+    try:
+        with wave.open(path, 'rb') as wav:
+            # Uncompressed segments must still fit under Whisper's upload limit
+            bytes_per_second = wav.getframerate() * wav.getsampwidth() * wav.getnchannels()
+    except (wave.Error, EOFError):
+        raise AudioSplitError("Splitting compressed audio requires ffmpeg")
+    segment_seconds = min(segment_seconds, int(WHISPER_MAX_BYTES * 0.95 / bytes_per_second))
+    overlap_seconds = min(overlap_seconds, segment_seconds // 4)
+    return _split_wav(path, segment_bounds(duration, segment_seconds, overlap_seconds), workdir)
+
+def needs_splitting(path, segment_seconds=600):
+    if os.path.getsize(path) > WHISPER_MAX_BYTES:
+        return True
+    try:
+        return audio_duration(path) > segment_seconds
+    except (AudioSplitError, subprocess.CalledProcessError, ValueError):
+        return False
+
+def _normalize_word(word):
+    return re.sub(r"[^\w']", "", word.lower())
+
+def stitch_transcripts(texts, max_overlap_words=40, min_overlap_words=2):
+    # Drop the words a segment repeats from the end of the previous one (the overlapped audio)
+    stitched = []
+    for text in texts:
+        words = text.split()
+        if stitched and words:
+            previous = [_normalize_word(word) for word in stitched[-max_overlap_words:]]
+            current = [_normalize_word(word) for word in words[:max_overlap_words]]
+            for size in range(min(len(previous), len(current)), min_overlap_words - 1, -1):
+                if previous[-size:] == current[:size]:
+                    words = words[size:]
+                    break
+        stitched.extend(words)
+    return " ".join(stitched)
+
+def split_transcript(text, max_tokens):
+    # Sentence-aligned chunks for map-reduce extraction over long transcripts
+    if count_tokens(text) <= max_tokens:
+        return [text]
+    chunks = []
+    current = []
+    size = 0
+    sentences = []
+    for sentence in re.split(r"(?<=[.!?])\s+", text.strip()):
+        if count_tokens(sentence) > max_tokens:
+            # Unpunctuated stretches get cut on word boundaries instead
+            words = sentence.split()
+            step = max(max_tokens * 3 // 4, 1)
+            sentences += [" ".join(words[i:i + step]) for i in range(0, len(words), step)]
+        else:
+            sentences.append(sentence)
+    for sentence in sentences:
+        sentence_tokens = count_tokens(sentence)
+        if current and size + sentence_tokens > max_tokens:
+            chunks.append(" ".join(current))
+            current, size = [], 0
+        current.append(sentence)
+        size += sentence_tokens
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
@@ -0,0 +1,56 @@
+import argparse
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingest import padlet_files, extract_padlet_files
+from redaction import DEFAULT_NAMES_TO_REDACT, Redactor
+
+
+def legacy_redact_sensitive_info(text):
+    # redact_sensitive_info as it was before the single-pass Redactor
+    text = re.sub(
+        r'\b(?!nyp_sns@nyp\.edu\.sg\b)[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b',
+        '[REDACTED EMAIL]',
+        text
+    )
+    text = re.sub(r'\b[689]\d{7}\b', '[REDACTED PHONE]', text)
+    text = re.sub(r'\b\d{8,}\b', '[REDACTED PHONE]', text)
+    text = re.sub(r'Age: ?\d+', 'Age: [REDACTED]', text)
+    for name in DEFAULT_NAMES_TO_REDACT:
+        pattern = re.compile(r'\b' + re.escape(name) + r'\b', re.IGNORECASE)
+        text = pattern.sub('[REDACTED NAME]', text)
+    return text
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the legacy redaction against the compiled Redactor")
+    parser.add_argument('folder', nargs='?', default=os.getenv('PADLET_CONTENT', 'padlet_content'))
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--chunk-size', type=int, default=16, help="characters per piece for the streaming check")
+    args = parser.parse_args()
+
+    paths = [os.path.join(args.folder, fname) for fname, _ in padlet_files(args.folder)]
+    corpus = "".join(text for text, _ in extract_padlet_files(paths, workers=1))
+    redactor = Redactor()
+
+    expected = legacy_redact_sensitive_info(corpus)
+    actual = redactor.redact(corpus)
+    pieces = [corpus[i:i + args.chunk_size] for i in range(0, len(corpus), args.chunk_size)]
+    streamed = "".join(redactor.stream(pieces))
+    print(f"corpus: {len(corpus)} chars from {len(paths)} files")
+    print(f"single-pass output matches legacy: {actual == expected}")
+    print(f"streamed output matches single-pass: {streamed == actual}")
+
+    legacy = min(timeit.repeat(lambda: legacy_redact_sensitive_info(corpus), number=1, repeat=args.repeat))
+    compiled = min(timeit.repeat(lambda: redactor.redact(corpus), number=1, repeat=args.repeat))
+    stream = min(timeit.repeat(lambda: "".join(redactor.stream(pieces)), number=1, repeat=args.repeat))
+    print(f"legacy:      {legacy * 1000:8.2f} ms")
+    print(f"single-pass: {compiled * 1000:8.2f} ms ({legacy / compiled:.1f}x)")
+    print(f"streamed:    {stream * 1000:8.2f} ms ({args.chunk_size}-char pieces)")
+
+
+if __name__ == '__main__':
+    main()
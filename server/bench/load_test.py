@@ -0,0 +1,418 @@
+import argparse
+import io
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+import wave
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from mock_openai import add_settings_arguments, settings_from_arguments, start_mock_server
+
+# Drives /chat, /chat/stream, /tts and /upload-audio at a fixed concurrency and reports latency percentiles,
+# throughput and per-stage timings, plus the server's own stage timings, cache hit rates and upstream
+# outcomes scraped from its /metrics endpoint. With --spawn it also starts the mock OpenAI API and the server under
+# test (gunicorn app:app, or hypercorn asgi_app:app with --server asgi) pointed at it, and measures startup.
+#   python load_test.py --spawn --concurrency 16 --requests 200
+#   python load_test.py --base-url http://127.0.0.1:3000 --scenarios chat,tts
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUESTIONS = [
+    "How do I book an appointment with a counsellor?",
+    "What support is available for students with dyslexia?",
+    "Where can I find the student care office?",
+    "How do I apply for special exam arrangements?",
+    "What should I do if I feel stressed about exams?",
+    "Who do I contact about financial assistance?",
+]
+
+TTS_TEXT = (
+    "Thanks for reaching out. You can book an appointment with a counsellor through the student portal. "
+    "If you need help sooner, please contact nyp_sns@nyp.edu.sg and the team will get back to you."
+)
+
+STARTUP_SCRIPT = """
+import json, os, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter() - started
+started = time.perf_counter()
+app.load_padlet_content(app.PADLET_CONTENT)
+print(json.dumps({'import_app': imported, 'load_padlet_content': time.perf_counter() - started}))
+os._exit(0)
+"""
+
+
+def percentile(values, pct):
+    # Nearest-rank percentile
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))]
+
+def request(url, data=None, headers=None, timeout=120):
+    return urllib.request.urlopen(urllib.request.Request(url, data=data, headers=headers or {}), timeout=timeout)
+
+def post_json(url, payload, timeout):
+    return request(url, json.dumps(payload).encode('utf-8'), {'Content-Type': 'application/json'}, timeout)
+
+def question(scenario, index, unique):
+    text = QUESTIONS[index % len(QUESTIONS)]
+    # The scenario name keeps one scenario from being answered from another's cached answers, and a number
+    # keeps the response cache from answering it at all (content words and numbers must match exactly)
+    return f"{text} (ref {scenario} {index})" if unique else f"{text} (ref {scenario})"
+
+def chat_scenario(args, index):
+    started = time.perf_counter()
+    payload = {'messages': [{'role': 'user', 'content': question('chat', index, args.unique)}]}
+    with post_json(args.base_url + '/chat', payload, args.timeout) as response:
+        body = json.load(response)
+    if 'response' not in body:
+        raise RuntimeError(body)
+    return {'total': time.perf_counter() - started}
+
+def chat_stream_scenario(args, index):
+    started = time.perf_counter()
+    stages = {}
+    payload = {'messages': [{'role': 'user', 'content': question('chat-stream', index, args.unique)}]}
+    event = None
+    with post_json(args.base_url + '/chat/stream', payload, args.timeout) as response:
+        for line in response:
+            line = line.decode('utf-8').strip()
+            if line.startswith('event: '):
+                event = line[7:]
+                stages.setdefault('first_event', time.perf_counter() - started)
+            elif line.startswith('data: ') and event == 'token':
+                stages.setdefault('first_token', time.perf_counter() - started)
+            elif line.startswith('data: ') and event == 'error':
+                raise RuntimeError(line)
+    if event != 'done':
+        raise RuntimeError(f"stream ended after '{event}'")
+    stages['total'] = time.perf_counter() - started
+    return stages
+
+def tts_scenario(args, index):
+    started = time.perf_counter()
+    stages = {}
+    text = TTS_TEXT + (f" Reference {index}." if args.unique else "")
+    path = '/tts/stream' if args.tts_stream else '/tts'
+    size = 0
+    with post_json(args.base_url + path, {'text': text}, args.timeout) as response:
+        for block in iter(lambda: response.read(16 * 1024), b''):
+            stages.setdefault('first_byte', time.perf_counter() - started)
+            size += len(block)
+    if not size:
+        raise RuntimeError("empty audio")
+    stages['total'] = time.perf_counter() - started
+    return stages
+
+def wav_bytes(seconds, seed):
+    # Noise rather than silence, so every upload hashes differently and gets its own job
+    rng = random.Random(seed)
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(16000)
+        wav.writeframes(rng.randbytes(seconds * 16000 * 2))
+    return buffer.getvalue()
+
+def multipart(field, filename, data, content_type):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"{field}\"; filename=\"{filename}\"\r\n"
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode('utf-8') + data + f"\r\n--{boundary}--\r\n".encode('utf-8')
+    return body, {'Content-Type': f'multipart/form-data; boundary={boundary}'}
+
+def upload_scenario(args, index):
+    started = time.perf_counter()
+    stages = {}
+    body, headers = multipart('file', f'meeting-{index}.wav', wav_bytes(args.audio_seconds, f'{args.seed}-{index}'), 'audio/wav')
+    with request(args.base_url + '/upload-audio', body, headers, args.timeout) as response:
+        job = json.load(response)
+    stages['upload'] = time.perf_counter() - started
+
+    # Poll like the client does, until the minutes are ready
+    while True:
+        try:
+            with request(f"{args.base_url}/audio-jobs/{job['job_id']}/result", timeout=args.timeout) as response:
+                if response.status == 200:
+                    break
+        except urllib.error.HTTPError as e:
+            raise RuntimeError(f"job failed: {e.read()[:200]!r}")
+        if time.perf_counter() - started > args.timeout:
+            raise RuntimeError("job timed out")
+        time.sleep(args.poll_interval)
+    stages['processing'] = time.perf_counter() - started - stages['upload']
+
+    download_started = time.perf_counter()
+    with request(f"{args.base_url}/download-audio-docx/{job['job_id']}", timeout=args.timeout) as response:
+        response.read()
+    stages['download'] = time.perf_counter() - download_started
+    stages['total'] = time.perf_counter() - started
+    return stages
+
+SCENARIOS = {
+    'chat': chat_scenario,
+    'chat-stream': chat_stream_scenario,
+    'tts': tts_scenario,
+    'upload': upload_scenario,
+}
+
+
+def scrape_metrics(base_url):
+    # Counter values and histogram sums/counts by sample name, or None if the server has no /metrics
+    try:
+        with request(base_url + '/metrics', timeout=10) as response:
+            text = response.read().decode('utf-8')
+    except (urllib.error.URLError, OSError):
+        return None
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#') and '_bucket{' not in line:
+            name, _, value = line.rpartition(' ')
+            samples[name] = float(value)
+    return samples
+
+def parse_sample(name):
+    metric, _, labels = name.partition('{')
+    return metric, dict(re.findall(r'(\w+)="((?:[^"\\]|\\.)*)"', labels))
+
+def server_summary(before, after):
+    # What the server recorded while one scenario ran
+    stage_sums, stage_counts = defaultdict(float), defaultdict(float)
+    summary = {'stages': {}, 'caches': defaultdict(dict), 'upstream': defaultdict(dict), 'tokens': defaultdict(dict)}
+    for name, value in after.items():
+        value -= before.get(name, 0.0)
+        if not value:
+            continue
+        metric, labels = parse_sample(name)
+        if metric == 'chatbot_stage_seconds_sum':
+            stage_sums[labels['stage']] = value
+        elif metric == 'chatbot_stage_seconds_count':
+            stage_counts[labels['stage']] = value
+        elif metric == 'chatbot_cache_requests_total':
+            summary['caches'][labels['cache']][labels['result']] = int(value)
+        elif metric == 'chatbot_upstream_requests_total':
+            summary['upstream'][labels['endpoint']][labels['outcome']] = int(value)
+        elif metric == 'chatbot_tokens_total':
+            summary['tokens'][labels['endpoint']][labels['kind']] = int(value)
+    for stage, count in stage_counts.items():
+        summary['stages'][stage] = {'count': int(count), 'mean': stage_sums[stage] / count}
+    return summary
+
+def run_scenario(args, name, count):
+    scenario = SCENARIOS[name]
+    stages = defaultdict(list)
+    errors = []
+    lock = threading.Lock()
+
+    def one(index):
+        try:
+            timings = scenario(args, index)
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+            return
+        with lock:
+            for stage, seconds in timings.items():
+                stages[stage].append(seconds)
+
+    metrics_before = scrape_metrics(args.base_url)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(one, range(count)))
+    elapsed = time.perf_counter() - started
+    metrics_after = scrape_metrics(args.base_url) if metrics_before is not None else None
+    return {
+        'server': server_summary(metrics_before, metrics_after) if metrics_after is not None else None,
+        'requests': count,
+        'errors': len(errors),
+        'sample_error': errors[0] if errors else None,
+        'seconds': elapsed,
+        'throughput': len(stages.get('total', [])) / elapsed if elapsed else 0.0,
+        'stages': {
+            stage: {
+                'p50': percentile(values, 50), 'p95': percentile(values, 95), 'p99': percentile(values, 99),
+                'mean': sum(values) / len(values)
+            }
+            for stage, values in stages.items()
+        }
+    }
+
+def measure_startup(env, folder):
+    # First run parses everything into an empty padlet cache; the second is a restart with it warm
+    results = {}
+    for label in ('cold', 'warm'):
+        output = subprocess.run(
+            [sys.executable, '-c', STARTUP_SCRIPT], cwd=SERVER_DIR, env={**env, 'PADLET_CONTENT': folder},
+            capture_output=True, text=True, check=True
+        ).stdout
+        results[label] = json.loads(output.strip().splitlines()[-1])
+    return results
+
+def wait_until_ready(base_url, process, timeout):
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with code {process.returncode}")
+        try:
+            request(base_url + '/audio-jobs/ready-check', timeout=1)
+        except urllib.error.HTTPError:
+            # Any HTTP answer (a 404 here) means the app is serving
+            return time.perf_counter() - started
+        except (urllib.error.URLError, ConnectionError, OSError):
+            time.sleep(0.1)
+    raise RuntimeError("server did not start in time")
+
+def spawn_server(args, env, port):
+    if args.server == 'asgi':
+        command = ['hypercorn', 'asgi_app:app', '--bind', f'127.0.0.1:{port}', '--workers', str(args.workers)]
+    else:
+        command = [
+            'gunicorn', 'app:app', '--bind', f'127.0.0.1:{port}', '--workers', str(args.workers),
+            '--threads', str(args.threads or args.concurrency), '--timeout', '300'
+        ]
+    log = open(os.path.join(env['BENCH_DIR'], 'server.log'), 'wb')
+    return subprocess.Popen(command, cwd=SERVER_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+def print_report(results):
+    print(f"\n{'scenario':<12} {'ok':>5} {'err':>4} {'req/s':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, result in results['scenarios'].items():
+        total = result['stages'].get('total', {})
+        print(
+            f"{name:<12} {result['requests'] - result['errors']:>5} {result['errors']:>4} {result['throughput']:>7.2f} "
+            f"{total.get('p50', 0) * 1000:>9.1f} {total.get('p95', 0) * 1000:>9.1f} {total.get('p99', 0) * 1000:>9.1f}"
+        )
+        for stage, timing in result['stages'].items():
+            if stage != 'total':
+                print(f"  {stage:<18} p50 {timing['p50'] * 1000:>8.1f} ms   p95 {timing['p95'] * 1000:>8.1f} ms")
+        if result['sample_error']:
+            print(f"  e.g. {result['sample_error'][:200]}")
+        server = result.get('server')
+        if server:
+            for stage, timing in sorted(server['stages'].items(), key=lambda item: -item[1]['mean']):
+                print(f"  server {stage:<27} mean {timing['mean'] * 1000:>8.1f} ms   n {timing['count']}")
+            for cache, counts in server['caches'].items():
+                lookups = sum(counts.values())
+                print(f"  {cache} cache hit rate {counts.get('hit', 0) / lookups:.0%} of {lookups}")
+            for endpoint, outcomes in server['upstream'].items():
+                print(f"  upstream {endpoint}: " + ", ".join(f"{outcome} {n}" for outcome, n in sorted(outcomes.items())))
+            for endpoint, kinds in server['tokens'].items():
+                print(f"  tokens {endpoint}: " + ", ".join(f"{kind} {n}" for kind, n in sorted(kinds.items())))
+    for label, timing in results.get('startup', {}).items():
+        print(f"startup ({label} cache): import app {timing['import_app']:.2f} s, "
+              f"load_padlet_content {timing['load_padlet_content']:.2f} s")
+    if 'server_ready' in results:
+        print(f"server ready after {results['server_ready']:.2f} s")
+    if results.get('upstream'):
+        print("upstream (mock) calls: " + ", ".join(
+            f"{key.split('/', 1)[1]} {count}" for key, count in sorted(results['upstream'].items())
+            if key.startswith('requests/')
+        ))
+
+def compare_with_baseline(results, baseline, max_regression):
+    # Flags any scenario whose p95 got more than max_regression slower than the saved baseline
+    regressions = []
+    for name, result in results['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name, {}).get('stages', {}).get('total', {}).get('p95')
+        after = result['stages'].get('total', {}).get('p95')
+        if before and after and after > before * (1 + max_regression):
+            regressions.append(f"{name}: p95 {before * 1000:.1f} ms -> {after * 1000:.1f} ms")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the chatbot server against a mock OpenAI API")
+    parser.add_argument('--base-url', default='http://127.0.0.1:3000', help="server under test (ignored with --spawn)")
+    parser.add_argument('--scenarios', default='chat,chat-stream,tts,upload')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=50, help="requests per scenario")
+    parser.add_argument('--upload-requests', type=int, default=None, help="uploads (default: a fifth of --requests)")
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--poll-interval', type=float, default=0.5)
+    parser.add_argument('--audio-seconds', type=int, default=20)
+    parser.add_argument('--tts-stream', action='store_true', help="use /tts/stream instead of /tts")
+    parser.add_argument('--repeat-questions', dest='unique', action='store_false',
+                        help="reuse the same questions and TTS text so caches can hit")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', help="write the results as JSON")
+    parser.add_argument('--baseline', help="results JSON to compare p95 latencies against")
+    parser.add_argument('--max-regression', type=float, default=0.2)
+
+    spawn = parser.add_argument_group('spawned server')
+    spawn.add_argument('--spawn', action='store_true', help="start the mock API and the server under test")
+    spawn.add_argument('--server', choices=['flask', 'asgi'], default='flask')
+    spawn.add_argument('--port', type=int, default=3100)
+    spawn.add_argument('--mock-port', type=int, default=8099)
+    spawn.add_argument('--workers', type=int, default=1)
+    spawn.add_argument('--threads', type=int, default=None, help="gunicorn threads per worker (default: --concurrency)")
+    spawn.add_argument('--padlet-content', default=os.getenv('PADLET_CONTENT', os.path.join(SERVER_DIR, 'padlet_content')))
+    spawn.add_argument('--keep-caches', action='store_true', help="leave the response and TTS caches enabled")
+    add_settings_arguments(spawn)
+    args = parser.parse_args()
+
+    results = {'config': {k: v for k, v in vars(args).items() if k not in ('save', 'baseline')}, 'scenarios': {}}
+    mock = process = None
+    if args.spawn:
+        mock = start_mock_server(port=args.mock_port, settings=settings_from_arguments(args))
+        bench_dir = tempfile.mkdtemp(prefix='chatbot_bench_')
+        env = {
+            **os.environ,
+            'BENCH_DIR': bench_dir,
+            'OPENAI_API_KEY': 'bench',
+            'OPENAI_BASE_URL': f'http://127.0.0.1:{args.mock_port}/v1',
+            'PADLET_CONTENT': os.path.abspath(args.padlet_content),
+            'PADLET_CACHE_DIR': os.path.join(bench_dir, 'cache'),
+            'AUDIO_JOBS_DIR': os.path.join(bench_dir, 'jobs'),
+        }
+        if not args.keep_caches:
+            env.update(RESPONSE_CACHE_SIZE='0', TTS_CACHE_MB='0')
+        print(f"Measuring startup (logs in {bench_dir})...")
+        results['startup'] = measure_startup(env, env['PADLET_CONTENT'])
+        args.base_url = f'http://127.0.0.1:{args.port}'
+        process = spawn_server(args, env, args.port)
+        results['server_ready'] = wait_until_ready(args.base_url, process, 120)
+
+    try:
+        for name in args.scenarios.split(','):
+            count = args.requests
+            if name == 'upload':
+                count = args.upload_requests or max(1, args.requests // 5)
+            print(f"Running {name}: {count} requests at concurrency {args.concurrency}...")
+            results['scenarios'][name] = run_scenario(args, name, count)
+        if mock is not None:
+            with request(f'http://127.0.0.1:{args.mock_port}/stats') as response:
+                results['upstream'] = json.load(response)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(30)
+        if mock is not None:
+            mock.shutdown()
+
+    print_report(results)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_with_baseline(results, json.load(f), args.max_regression)
+        for line in regressions:
+            print("REGRESSION", line)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Stand-in for the OpenAI API so the server can be load tested without credits. Point the app at it with
+# OPENAI_BASE_URL=http://127.0.0.1:8099/v1. Latency is `--latency` seconds to the first token plus
+# completion tokens at `--tokens-per-second`; transcription and speech scale with upload and input size.
+
+WORDS = (
+    "the student asked about the counselling service and the team agreed to follow up with the school "
+    "next week on the timetable the budget and the new support plan"
+).split()
+
+
+def fake_text(tokens):
+    # Roughly one token per word
+    return " ".join(WORDS[i % len(WORDS)] for i in range(tokens)) + "."
+
+
+class MockSettings:
+    def __init__(self, latency=0.3, tokens_per_second=50.0, completion_tokens=120, transcribe_seconds_per_mb=2.0,
+                 transcript_words=600, speech_latency=0.2, speech_chars_per_second=400.0, error_rate=0.0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.transcribe_seconds_per_mb = transcribe_seconds_per_mb
+        self.transcript_words = transcript_words
+        self.speech_latency = speech_latency
+        self.speech_chars_per_second = speech_chars_per_second
+        self.error_rate = error_rate
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    settings = MockSettings()
+    stats = Counter()
+    stats_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def count(self, key, amount=1):
+        with self.stats_lock:
+            self.stats[key] += amount
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            with self.stats_lock:
+                self.send_json(200, dict(self.stats))
+        else:
+            self.send_json(404, {'error': {'message': 'Not found'}})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        endpoint = self.path.split('?')[0].rstrip('/').rsplit('/v1', 1)[-1]
+        self.count(f'requests{endpoint}')
+        if random.random() < self.settings.error_rate:
+            self.count('errors')
+            self.send_json(503, {'error': {'message': 'Injected failure', 'type': 'server_error'}})
+            return
+        started = time.perf_counter()
+        if endpoint == '/chat/completions':
+            self.chat_completion(json.loads(body))
+        elif endpoint == '/audio/transcriptions':
+            time.sleep(self.settings.latency + len(body) / (1024 * 1024) * self.settings.transcribe_seconds_per_mb)
+            self.send_json(200, {'text': fake_text(self.settings.transcript_words)})
+        elif endpoint == '/audio/speech':
+            text = json.loads(body).get('input', '')
+            time.sleep(self.settings.speech_latency + len(text) / self.settings.speech_chars_per_second)
+            # About 1 KB of "MP3" per 20 characters, like 64 kbps speech
+            audio = b'\xff\xf3' * (max(len(text), 1) * 25)
+            self.send_response(200)
+            self.send_header('Content-Type', 'audio/mpeg')
+            self.send_header('Content-Length', str(len(audio)))
+            self.end_headers()
+            self.wfile.write(audio)
+        else:
+            self.send_json(404, {'error': {'message': f'Unknown endpoint {endpoint}'}})
+            return
+        self.count(f'seconds{endpoint}', time.perf_counter() - started)
+
+    def chat_completion(self, params):
+        messages = params.get('messages', [])
+        system = messages[0].get('content', '') if messages else ''
+        if 'detecting distress' in system:
+            content, tokens = 'safe', 1
+        elif (params.get('response_format') or {}).get('type') == 'json_object':
+            content = json.dumps({
+                'abstract_summary': fake_text(60), 'key_points': fake_text(30),
+                'action_items': fake_text(30), 'sentiment': 'Neutral.'
+            })
+            tokens = self.settings.completion_tokens
+        else:
+            tokens = self.settings.completion_tokens
+            content = fake_text(tokens)
+        prompt_tokens = sum(len(str(message.get('content', ''))) for message in messages) // 4
+        usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': tokens, 'total_tokens': prompt_tokens + tokens}
+        completion_id = 'chatcmpl-' + uuid.uuid4().hex
+        model = params.get('model', 'gpt-3.5-turbo')
+        time.sleep(self.settings.latency)
+
+        if not params.get('stream'):
+            time.sleep(tokens / self.settings.tokens_per_second)
+            self.send_json(200, {
+                'id': completion_id, 'object': 'chat.completion', 'created': int(time.time()), 'model': model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+                'usage': usage
+            })
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def send_chunk(payload):
+            data = f"data: {payload}\n\n".encode('utf-8')
+            self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+            self.wfile.flush()
+
+        def chunk(delta, finish_reason=None):
+            return json.dumps({
+                'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+            })
+
+        send_chunk(chunk({'role': 'assistant', 'content': ''}))
+        for word in content.split(' '):
+            time.sleep(1 / self.settings.tokens_per_second)
+            send_chunk(chunk({'content': word + ' '}))
+        send_chunk(chunk({}, 'stop'))
+        if (params.get('stream_options') or {}).get('include_usage'):
+            send_chunk(json.dumps({
+                'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model,
+                'choices': [], 'usage': usage
+            }))
+        send_chunk('[DONE]')
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def start_mock_server(host='127.0.0.1', port=8099, settings=None):
+    # Serves from a daemon thread; returns the server (call shutdown() to stop it)
+    if settings is not None:
+        MockOpenAIHandler.settings = settings
+    server = ThreadingHTTPServer((host, port), MockOpenAIHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name='mock-openai').start()
+    return server
+
+def add_settings_arguments(parser):
+    defaults = MockSettings()
+    parser.add_argument('--latency', type=float, default=defaults.latency, help="seconds before the first token")
+    parser.add_argument('--tokens-per-second', type=float, default=defaults.tokens_per_second)
+    parser.add_argument('--completion-tokens', type=int, default=defaults.completion_tokens)
+    parser.add_argument('--transcribe-seconds-per-mb', type=float, default=defaults.transcribe_seconds_per_mb)
+    parser.add_argument('--transcript-words', type=int, default=defaults.transcript_words)
+    parser.add_argument('--speech-latency', type=float, default=defaults.speech_latency)
+    parser.add_argument('--speech-chars-per-second', type=float, default=defaults.speech_chars_per_second)
+    parser.add_argument('--error-rate', type=float, default=defaults.error_rate, help="fraction of calls answered with a 503")
+
+def settings_from_arguments(args):
+    return MockSettings(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        transcribe_seconds_per_mb=args.transcribe_seconds_per_mb,
+        transcript_words=args.transcript_words,
+        speech_latency=args.speech_latency,
+        speech_chars_per_second=args.speech_chars_per_second,
+        error_rate=args.error_rate
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible API for load testing")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    server = start_mock_server(args.host, args.port, settings_from_arguments(args))
+    print(f"Mock OpenAI API on http://{args.host}:{args.port}/v1 (GET /stats for call counts)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
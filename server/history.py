@@ -0,0 +1,46 @@
+from tokens import message_tokens
+
+
+def compact_history(messages, budget, keep_messages=6, summarize=None, summary_block=8):
+    # Fit the conversation into `budget` tokens. The latest `keep_messages` are always kept (trimmed only
+    # if they alone overflow, and never the last one); older messages are kept newest-first while they
+    # fit, and the rest are dropped or, with `summarize`, replaced by summaries of fixed-size blocks.
+    # Blocks are aligned to the start of the conversation so their summaries stay cacheable across turns.
+    sizes = [message_tokens(message) for message in messages]
+    info = {
+        'history_tokens': sum(sizes),
+        'history_messages_dropped': 0,
+        'history_messages_summarized': 0
+    }
+    if info['history_tokens'] <= budget:
+        return list(messages), info
+
+    split = max(len(messages) - keep_messages, 0)
+    used = sum(sizes[split:])
+    # The recent window alone is over budget: drop its oldest messages, keeping at least the last one
+    while used > budget and split < len(messages) - 1:
+        used -= sizes[split]
+        split += 1
+
+    start = split
+    while start > 0 and used + sizes[start - 1] <= budget:
+        start -= 1
+        used += sizes[start]
+    kept = list(messages[start:])
+
+    summaries = []
+    if summarize is not None and start > 0:
+        blocks = [messages[i:min(i + summary_block, start)] for i in range(0, start, summary_block)]
+        # Newest blocks first, so the most recent context survives a tight budget
+        for block in reversed(blocks):
+            summary = {"role": "system", "content": "Summary of an earlier part of this conversation: " + summarize(block)}
+            size = message_tokens(summary)
+            if used + size > budget:
+                break
+            summaries.insert(0, summary)
+            used += size
+            info['history_messages_summarized'] += len(block)
+
+    info['history_messages_dropped'] = start - info['history_messages_summarized']
+    info['history_tokens'] = used
+    return summaries + kept, info
@@ -0,0 +1,74 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pdfplumber
+
+# Kept free of app imports so pool workers can import it cheaply
+
+
+def padlet_files(folder):
+    # .txt files first, then .pdf files, each listed with its section title
+    names = os.listdir(folder)
+    files = [(fname, fname.replace('_', ' ').replace('.txt','').title()) for fname in names if fname.lower().endswith('.txt')]
+    files += [(fname, fname) for fname in names if fname.lower().endswith('.pdf')]
+    return files
+
+def read_text_file(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read() + "\n"
+
+def pdf_page_count(path):
+    with pdfplumber.open(path) as pdf:
+        return len(pdf.pages)
+
+def extract_pdf_pages(path, start, stop):
+    parts = []
+    with pdfplumber.open(path) as pdf:
+        for page in pdf.pages[start:stop]:
+            page_text = page.extract_text()
+            if page_text:
+                parts.append(page_text + "\n")
+            page.close()
+    return "".join(parts)
+
+def _timed_pdf_pages(path, start, stop):
+    start_time = time.perf_counter()
+    return extract_pdf_pages(path, start, stop), time.perf_counter() - start_time
+
+def extract_padlet_files(paths, workers=None, pages_per_task=4):
+    # Fan PDF page ranges out over a process pool and stitch each file back in page order.
+    # Returns (text, seconds spent extracting) per path, in the order given.
+    workers = workers or os.cpu_count() or 1
+    texts = {}
+    timings = {}
+    for path in paths:
+        if path.lower().endswith('.txt'):
+            start_time = time.perf_counter()
+            texts[path] = read_text_file(path)
+            timings[path] = time.perf_counter() - start_time
+    pdf_paths = [path for path in paths if path not in texts]
+    tasks = []
+    for path in pdf_paths:
+        page_count = pdf_page_count(path)
+        tasks += [(path, start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)]
+
+    if workers <= 1 or len(tasks) <= 1:
+        results = [_timed_pdf_pages(*task) for task in tasks]
+    else:
+        # spawn, not fork: ingestion can run from the reload thread of a multi-threaded server
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), mp_context=context) as pool:
+            futures = [pool.submit(_timed_pdf_pages, *task) for task in tasks]
+            results = [future.result() for future in futures]
+
+    parts = {path: [] for path in pdf_paths}
+    for path in pdf_paths:
+        timings[path] = 0.0
+    for (path, _, _), (text, elapsed) in zip(tasks, results):
+        parts[path].append(text)
+        timings[path] += elapsed
+    for path in pdf_paths:
+        texts[path] = "".join(parts[path])
+    return [(texts[path], timings[path]) for path in paths]
@@ -0,0 +1,210 @@
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+logger = logging.getLogger('chatbot.jobs')
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class JobError(Exception):
+    # Raised by job processors with a message that is safe to show to the user
+    pass
+
+
+class JobQueue:
+    # Local audio job queue: state lives in SQLite so any worker process can answer status polls,
+    # and each process runs the jobs it accepted on its own thread pool. Finished and failed jobs (with
+    # their transcripts and minutes) are unreadable `retention` seconds after they ended, and deleted by
+    # a background pruner shortly after.
+    def __init__(self, jobs_dir, process, workers=2, stale_after=3600, retention=3600):
+        os.makedirs(jobs_dir, exist_ok=True)
+        self.jobs_dir = jobs_dir
+        self.db_path = os.path.join(jobs_dir, 'jobs.sqlite3')
+        self.process = process
+        self.stale_after = stale_after
+        self.retention = retention
+        self._pruner = None
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='audio-job')
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    file_hash TEXT NOT NULL UNIQUE,
+                    filename TEXT NOT NULL,
+                    audio_path TEXT,
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        # Deleted results are overwritten on disk, not just unlinked from the table
+        conn.execute("PRAGMA secure_delete = ON")
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _row_to_job(self, row):
+        job = {
+            'job_id': row['id'],
+            'status': row['status'],
+            'filename': row['filename'],
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at']
+        }
+        if row['error']:
+            job['error'] = row['error']
+        return job
+
+    def _expired_before(self):
+        return time.time() - self.retention
+
+    def _delete_expired(self, conn):
+        return conn.execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?", (DONE, FAILED, self._expired_before())
+        ).rowcount
+
+    def submit(self, upload_path, filename, file_hash):
+        # Idempotent on file contents: the same audio returns its existing job unless that job failed
+        now = time.time()
+        with self._connect() as conn:
+            # Take the write lock up front so two identical uploads cannot both insert
+            conn.execute("BEGIN IMMEDIATE")
+            # An expired job for the same audio is gone, so it is transcribed again
+            self._delete_expired(conn)
+            row = conn.execute("SELECT * FROM jobs WHERE file_hash = ?", (file_hash,)).fetchone()
+            if row is not None and row['status'] != FAILED:
+                os.remove(upload_path)
+                return self._row_to_job(row), False
+            job_id = row['id'] if row is not None else uuid.uuid4().hex
+            audio_path = os.path.join(self.jobs_dir, job_id + os.path.splitext(filename)[1].lower())
+            shutil.move(upload_path, audio_path)
+            if row is None:
+                conn.execute(
+                    "INSERT INTO jobs (id, file_hash, filename, audio_path, status, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, file_hash, filename, audio_path, QUEUED, now, now)
+                )
+            else:
+                conn.execute(
+                    "UPDATE jobs SET filename = ?, audio_path = ?, status = ?, result = NULL, error = NULL, updated_at = ? "
+                    "WHERE id = ?",
+                    (filename, audio_path, QUEUED, now, job_id)
+                )
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        self.executor.submit(self._run, job_id)
+        return self._row_to_job(row), True
+
+    def get(self, job_id):
+        # Expired jobs read as missing even before the pruner deletes them
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE id = ? AND (status NOT IN (?, ?) OR updated_at >= ?)",
+                (job_id, DONE, FAILED, self._expired_before())
+            ).fetchone()
+        return self._row_to_job(row) if row is not None else None
+
+    def result(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT result FROM jobs WHERE id = ? AND status = ? AND updated_at >= ?",
+                (job_id, DONE, self._expired_before())
+            ).fetchone()
+        return json.loads(row['result']) if row is not None else None
+
+    def _claim(self, job_id):
+        # Only one worker (thread or process) gets to move a job from queued to running
+        with self._connect() as conn:
+            claimed = conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND status = ?",
+                (RUNNING, time.time(), job_id, QUEUED)
+            ).rowcount
+            row = conn.execute("SELECT audio_path, filename FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row if claimed else None
+
+    def _finish(self, job_id, status, result=None, error=None):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, audio_path = NULL, updated_at = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id)
+            )
+
+    def _run(self, job_id):
+        row = self._claim(job_id)
+        if row is None:
+            return
+        start = time.perf_counter()
+        try:
+            result = self.process(job_id, row['audio_path'], row['filename'])
+            self._finish(job_id, DONE, result=result)
+            logger.info("Audio job %s finished in %.1fs", job_id, time.perf_counter() - start)
+        except JobError as e:
+            logger.warning("Audio job %s rejected: %s", job_id, e)
+            self._finish(job_id, FAILED, error=str(e))
+        except Exception:
+            logger.exception("Audio job %s failed", job_id)
+            self._finish(job_id, FAILED, error='An error occurred while processing the audio file.')
+        finally:
+            if row['audio_path'] and os.path.exists(row['audio_path']):
+                os.remove(row['audio_path'])
+            self.prune()
+
+    def prune(self):
+        # Delete finished and failed jobs older than the retention period
+        with self._connect() as conn:
+            deleted = self._delete_expired(conn)
+        if deleted:
+            logger.info("Deleted %d expired audio job(s)", deleted)
+        return deleted
+
+    def _prune_loop(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.prune()
+            except Exception:
+                logger.exception("Pruning audio jobs failed")
+
+    def start_pruner(self, interval=60):
+        # Deletes expired jobs even while no new ones finish
+        if self._pruner is None:
+            interval = max(1, min(interval, self.retention))
+            self._pruner = threading.Thread(target=self._prune_loop, args=(interval,), name='audio-job-prune', daemon=True)
+            self._pruner.start()
+
+    def resume(self):
+        # Pick up jobs left queued by a restart, and requeue jobs whose worker died mid-run
+        self.prune()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ? AND updated_at < ?",
+                (QUEUED, time.time(), RUNNING, time.time() - self.stale_after)
+            )
+            job_ids = [row['id'] for row in conn.execute(
+                "SELECT id FROM jobs WHERE status = ? AND audio_path IS NOT NULL", (QUEUED,)
+            )]
+        for job_id in job_ids:
+            self.executor.submit(self._run, job_id)
+        return job_ids
@@ -0,0 +1,105 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+logger = logging.getLogger('chatbot.knowledge_base')
+
+PadletSnapshot = namedtuple('PadletSnapshot', [
+    'version', 'signature', 'raw_documents', 'redacted_documents', 'raw_content', 'redacted_content', 'index'
+])
+
+
+def folder_signature(folder, extensions=('.txt', '.pdf')):
+    # Cheap stat-only view of the folder, used to notice added, changed or removed files
+    entries = []
+    for entry in os.scandir(folder):
+        if entry.is_file() and entry.name.lower().endswith(extensions):
+            stat = entry.stat()
+            entries.append((entry.name, stat.st_size, stat.st_mtime_ns))
+    return tuple(sorted(entries))
+
+def content_version(documents):
+    digest = hashlib.sha256()
+    for title, text in documents:
+        digest.update(title.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(text.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()[:16]
+
+def diff_signatures(old, new):
+    old_files = {name: rest for name, *rest in old}
+    new_files = {name: rest for name, *rest in new}
+    added = sorted(set(new_files) - set(old_files))
+    removed = sorted(set(old_files) - set(new_files))
+    changed = sorted(name for name in set(old_files) & set(new_files) if old_files[name] != new_files[name])
+    return added, changed, removed
+
+
+class KnowledgeBase:
+    # Holds the current padlet snapshot. Reloads build a new snapshot off to the side and swap the
+    # reference in one assignment, so requests that already grabbed current() keep the old one.
+    def __init__(self, folder, load_snapshot):
+        self.folder = folder
+        self.load_snapshot = load_snapshot
+        self._snapshot = load_snapshot(folder)
+        self._lock = threading.Lock()
+        self._reloading = False
+        self._pending = False
+        self._watcher = None
+
+    def current(self):
+        return self._snapshot
+
+    def reload(self):
+        signature = folder_signature(self.folder)
+        old = self._snapshot
+        if signature == old.signature:
+            return old
+        added, changed, removed = diff_signatures(old.signature, signature)
+        start = time.perf_counter()
+        snapshot = self.load_snapshot(self.folder)
+        self._snapshot = snapshot
+        logger.info(
+            "Padlet content reloaded in %.3fs (version %s -> %s, added=%s changed=%s removed=%s)",
+            time.perf_counter() - start, old.version, snapshot.version, added, changed, removed
+        )
+        return snapshot
+
+    def reload_in_background(self):
+        with self._lock:
+            if self._reloading:
+                self._pending = True
+                return False
+            self._reloading = True
+        threading.Thread(target=self._reload_loop, name='padlet-reload', daemon=True).start()
+        return True
+
+    def _reload_loop(self):
+        while True:
+            try:
+                self.reload()
+            except Exception:
+                logger.exception("Padlet content reload failed; keeping version %s", self._snapshot.version)
+            with self._lock:
+                if not self._pending:
+                    self._reloading = False
+                    return
+                self._pending = False
+
+    def start_watcher(self, interval):
+        if interval <= 0 or self._watcher is not None:
+            return
+        def watch():
+            while True:
+                time.sleep(interval)
+                try:
+                    if folder_signature(self.folder) != self._snapshot.signature:
+                        self.reload_in_background()
+                except OSError:
+                    logger.exception("Could not scan %s for padlet changes", self.folder)
+        self._watcher = threading.Thread(target=watch, name='padlet-watcher', daemon=True)
+        self._watcher.start()
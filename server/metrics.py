@@ -0,0 +1,175 @@
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Minimal Prometheus-style metrics (text exposition format 0.0.4). Values live in this process, so with
+# several gunicorn workers each scrape sees one worker; run one worker with threads, or scrape each.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in pairs) + '}'
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name + format_labels(self.labels, key), value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets) + (math.inf,)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        for key, (counts, total) in sorted(values.items()):
+            for bound, count in zip(self.buckets, counts):
+                yield self.name + '_bucket' + format_labels(self.labels, key, [('le', format_value(bound))]), count
+            yield self.name + '_sum' + format_labels(self.labels, key), total
+            yield self.name + '_count' + format_labels(self.labels, key), counts[-1]
+
+
+class Gauge:
+    # Read at scrape time from `collect`, which returns {label values tuple: value}
+    kind = 'gauge'
+
+    def __init__(self, name, help, collect, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.collect = collect
+
+    def samples(self):
+        for key, value in sorted(self.collect().items()):
+            yield self.name + format_labels(self.labels, key), value
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, collect, labels=()):
+        return self.register(Gauge(name, help, collect, labels))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{sample} {format_value(value)}" for sample, value in metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+STAGE_SECONDS = REGISTRY.histogram('chatbot_stage_seconds', "Time spent in each processing stage", ['stage'])
+HTTP_REQUESTS = REGISTRY.counter('chatbot_http_requests_total', "HTTP requests by route and status", ['route', 'method', 'status'])
+HTTP_SECONDS = REGISTRY.histogram('chatbot_http_request_seconds', "Time until the response starts", ['route'])
+CHAT_INTENTS = REGISTRY.counter('chatbot_chat_intents_total', "Chat messages by detected intent", ['intent'])
+CACHE_REQUESTS = REGISTRY.counter('chatbot_cache_requests_total', "Cache lookups by cache and result", ['cache', 'result'])
+TOKENS = REGISTRY.counter('chatbot_tokens_total', "Tokens reported by the OpenAI API", ['endpoint', 'kind'])
+UPSTREAM_REQUESTS = REGISTRY.counter(
+    'chatbot_upstream_requests_total',
+    "OpenAI API attempts by outcome (ok, error, transient, circuit_open, busy)", ['endpoint', 'outcome']
+)
+UPSTREAM_SECONDS = REGISTRY.histogram('chatbot_upstream_seconds', "OpenAI API attempt latency", ['endpoint'])
+
+
+# Stage timings of the current request or job, for its structured log line. Threads started for the
+# request must run in a copy of its context (contextvars.copy_context().run); asyncio tasks and
+# asyncio.to_thread do that on their own.
+_timings = ContextVar('chatbot_timings', default=None)
+
+def start_timings():
+    timings = {}
+    _timings.set(timings)
+    return timings
+
+def observe_stage(stage, seconds, timings=None):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = timings if timings is not None else _timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+@contextmanager
+def timed(stage):
+    # Also works as a decorator (for plain functions; time coroutines with `with timed(...)` inside them)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+def record_tokens(endpoint, usage):
+    if usage is None:
+        return
+    for kind in ('prompt_tokens', 'completion_tokens'):
+        count = getattr(usage, kind, None)
+        if count:
+            TOKENS.inc(count, endpoint=endpoint, kind=kind[:-len('_tokens')])
+
+def log_event(logger, event, timings=None, **fields):
+    # One JSON object per event, e.g. `chat {"intent": "safe", ..., "stages_ms": {...}}`
+    if timings:
+        fields['stages_ms'] = {stage: round(seconds * 1000, 1) for stage, seconds in timings.items()}
+    logger.info("%s %s", event, json.dumps(fields, default=str))
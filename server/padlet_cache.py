@@ -0,0 +1,94 @@
+import hashlib
+import os
+import sqlite3
+from collections import namedtuple
+from contextlib import contextmanager
+
+Fingerprint = namedtuple('Fingerprint', ['path', 'size', 'mtime_ns', 'sha256'])
+CacheEntry = namedtuple('CacheEntry', ['raw', 'redacted'])
+
+
+def file_fingerprint(path):
+    stat = os.stat(path)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return Fingerprint(os.path.abspath(path), stat.st_size, stat.st_mtime_ns, digest.hexdigest())
+
+
+class PadletCache:
+    # Extracted and redacted text per padlet file, shared by every worker through one SQLite file
+    def __init__(self, cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db_path = os.path.join(cache_dir, 'padlet_content.sqlite3')
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS documents (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    redaction_version TEXT NOT NULL,
+                    raw TEXT NOT NULL,
+                    redacted TEXT NOT NULL
+                )
+                """
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, fingerprint, redaction_version, redact=None):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT size, mtime_ns, sha256, redaction_version, raw, redacted FROM documents WHERE path = ?",
+                (fingerprint.path,)
+            ).fetchone()
+            if row is None or row[2] != fingerprint.sha256:
+                return None
+            size, mtime_ns, _, cached_version, raw, redacted = row
+            if cached_version != redaction_version:
+                # Same file, new redaction rules: re-redact the cached text instead of re-parsing
+                if redact is None:
+                    return None
+                redacted = redact(raw)
+                self.put(fingerprint, raw, redacted, redaction_version, conn)
+            elif (size, mtime_ns) != (fingerprint.size, fingerprint.mtime_ns):
+                # Touched but unchanged content (e.g. re-copied): refresh the stat fields
+                conn.execute(
+                    "UPDATE documents SET size = ?, mtime_ns = ? WHERE path = ?",
+                    (fingerprint.size, fingerprint.mtime_ns, fingerprint.path)
+                )
+            return CacheEntry(raw, redacted)
+
+    def put(self, fingerprint, raw, redacted, redaction_version, conn=None):
+        if conn is None:
+            with self._connect() as conn:
+                return self.put(fingerprint, raw, redacted, redaction_version, conn)
+        conn.execute(
+            "INSERT OR REPLACE INTO documents (path, size, mtime_ns, sha256, redaction_version, raw, redacted) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (fingerprint.path, fingerprint.size, fingerprint.mtime_ns, fingerprint.sha256,
+             redaction_version, raw, redacted)
+        )
+
+    def prune(self, folder, paths):
+        # Drop entries for files that have been removed from the folder
+        prefix = os.path.join(os.path.abspath(folder), '')
+        keep = {os.path.abspath(path) for path in paths}
+        with self._connect() as conn:
+            stale = [
+                row[0] for row in conn.execute("SELECT path FROM documents")
+                if row[0].startswith(prefix) and row[0] not in keep
+            ]
+            conn.executemany("DELETE FROM documents WHERE path = ?", [(path,) for path in stale])
+        return stale
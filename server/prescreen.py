@@ -0,0 +1,62 @@
+import re
+
+# Local pre-screen for /chat: a message may skip the remote distress classifier only if it is clearly
+# benign, i.e. a bare greeting or a short FAQ/logistics question with no first-person content beyond
+# "how do I ..."-style openings. Anything not on this allowlist goes to the classifier.
+
+GREETING = re.compile(
+    r"^(hi|hello|hey|hiya|good (morning|afternoon|evening)|thanks|thank you|ok|okay|bye|goodbye)"
+    r"( there| all| so much| very much)?\b[\s,.!]*",
+    re.IGNORECASE
+)
+
+# The opening of a question, including a first-person "do I" / "can I" that asks about procedure
+QUESTION_OPENING = re.compile(
+    r"^(how|what|where|when|which|who|can|could|may|is|are|do|does|will|would|should)\b"
+    r"(\s+(long|much|many|do|does|can|could|may|should|would|will|is|are|am)\b)?"
+    r"(\s+(i|we)\b)?",
+    re.IGNORECASE
+)
+
+# The question has to be about something the consultant handles
+LOGISTICS_TOPICS = re.compile(
+    r"\b(appl(y|ies|ication)\w*|fund\w*|grant|bursar\w*|scholarship\w*|fees?|exams?|examination\w*|tests?|"
+    r"timetable\w*|schedule\w*|deadline\w*|forms?|documents?|submi(t|ssion)\w*|register\w*|registration|"
+    r"enrol\w*|modules?|courses?|lectures?|tutorials?|class(es)?|semester\w*|term|holidays?|leave|"
+    r"medical certificate|mc|extra time|accommodation\w*|arrangement\w*|assistive|device\w*|laptop\w*|"
+    r"office|campus|block|room|library|email|e-mail|contact|phone number|hours|open(ing)?|located|"
+    r"location|upload\w*|transcri\w*|audio|voice mode|docx|download\w*|microphone|sns|sen|special needs)\b",
+    re.IGNORECASE
+)
+
+FIRST_PERSON = re.compile(r"\b(i|i'?m|i'?ve|i'?ll|i'?d|me|my|mine|myself)\b", re.IGNORECASE)
+
+# Second line of defence: never wave through anything that touches emotion, harm or reliance on the AI
+DISTRESS_CUES = re.compile(
+    r"\b(sad|unhappy|depress\w*|anxi\w*|stress\w*|panic\w*|cry\w*|tears?|lonely|alone|isolat\w*|"
+    r"hopeless|helpless|worthless|useless|empty|numb|hate|angry|anger|mad|upset|frustrat\w*|annoy\w*|"
+    r"scared|afraid|fear\w*|terrified|overwhelm\w*|exhaust\w*|tired|give up|giving up|cope|coping|"
+    r"fail\w*|suicid\w*|kill\w*|die|dying|dead|death|live|living|alive|life|hurt\w*|harm\w*|pain\w*|"
+    r"cut\w*|bleed\w*|jump\w*|hang\w*|stab\w*|shoot\w*|overdose|pills?|meds|medication|poison\w*|"
+    r"end it|no point|not worth|better off|disappear|goodbye forever|weapon|gun|knife|rope|roof|bridge|"
+    r"revenge|bully\w*|abuse\w*|trauma\w*|better than|only you|only one who|need you|love you|"
+    r"friend|counsell?or\w*|human|people|nobody|no one|anyone|understand me|help me)\b",
+    re.IGNORECASE
+)
+
+
+def is_benign(message, max_words=40):
+    message = message.strip()
+    if not message or len(message.split()) > max_words or DISTRESS_CUES.search(message):
+        return False
+    rest = GREETING.sub("", message, count=1).strip()
+    if not rest:
+        return True
+    # Exactly one question: no further sentences after it
+    if re.search(r"[.!?;]\s*\S", rest) or "\n" in rest:
+        return False
+    opening = QUESTION_OPENING.match(rest)
+    if not opening:
+        return False
+    rest = rest[opening.end():]
+    return not FIRST_PERSON.search(rest) and bool(LOGISTICS_TOPICS.search(rest))
@@ -0,0 +1,94 @@
+import hashlib
+import re
+
+DEFAULT_NAMES_TO_REDACT = [
+    "Audrey Wai", "John Tan", "Marcus Lee", "Jessie Tang", "Liew Tian En",
+    "Ng Su Li", "Soh Lay Hong", "Megane Wong", "Khoo Kiah Hong", "Chai Kuek Heng",
+    "Akram", "Ridzuan", "Kah Wee", "Al", "Dloysius", "Nurul Assyakirin Izzati", "Sasha"
+]
+
+REPLACEMENTS = {
+    'email': '[REDACTED EMAIL]',
+    'phone': '[REDACTED PHONE]',
+    'age': 'Age: [REDACTED]',
+    'name': '[REDACTED NAME]',
+}
+
+
+def load_names(path):
+    # One name per line; blank lines and lines starting with '#' are ignored
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+
+
+class Redactor:
+    # All redaction rules compiled into one alternation, so each text is scanned once
+    def __init__(self, names=DEFAULT_NAMES_TO_REDACT):
+        # Longest names first so "Liew Tian En" wins over any shorter name starting at the same spot
+        names = sorted(set(names), key=lambda name: (-len(name), name))
+        rules = [
+            # Emails except nyp_sns@nyp.edu.sg
+            r'(?P<email>\b(?!nyp_sns@nyp\.edu\.sg\b)[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b)',
+            # Singapore phone numbers (8 digits, starting with 6, 8, or 9) and generic 8+ digit numbers
+            r'(?P<phone>\b[689]\d{7}\b|\b\d{8,}\b)',
+            # Ages (e.g., "Age: 21")
+            r'(?P<age>Age: ?\d+)',
+        ]
+        if names:
+            rules.append(r'(?P<name>(?i:\b(?:' + '|'.join(re.escape(name) for name in names) + r')\b))')
+        self.pattern = re.compile('|'.join(rules))
+        self.version = hashlib.sha256(self.pattern.pattern.encode('utf-8')).hexdigest()[:16]
+        # Longest span a match can have across whitespace; streamed text holds this much back
+        self.holdback = max([len(name) for name in names] + [len('Age: ')]) + 1
+
+    def _replace(self, match):
+        return REPLACEMENTS[match.lastgroup]
+
+    def redact(self, text):
+        return self.pattern.sub(self._replace, text)
+
+    def stream(self, chunks):
+        stream = StreamRedactor(self)
+        for chunk in chunks:
+            ready = stream.feed(chunk)
+            if ready:
+                yield ready
+        tail = stream.flush()
+        if tail:
+            yield tail
+
+
+class StreamRedactor:
+    # Incremental redaction for text that arrives in pieces (e.g. streamed completions).
+    # Only releases text up to a whitespace boundary that no possible match can straddle.
+    def __init__(self, redactor):
+        self.redactor = redactor
+        self.buffer = ""
+
+    def _safe_cut(self):
+        limit = len(self.buffer) - self.redactor.holdback
+        cut = 0
+        for i in range(limit - 1, -1, -1):
+            if self.buffer[i].isspace():
+                cut = i + 1
+                break
+        if cut:
+            for match in self.redactor.pattern.finditer(self.buffer):
+                if match.start() >= cut:
+                    break
+                if match.end() > cut:
+                    cut = match.start()
+                    break
+        return cut
+
+    def feed(self, text):
+        self.buffer += text
+        cut = self._safe_cut()
+        if not cut:
+            return ""
+        ready, self.buffer = self.buffer[:cut], self.buffer[cut:]
+        return self.redactor.redact(ready)
+
+    def flush(self):
+        ready, self.buffer = self.buffer, ""
+        return self.redactor.redact(ready)
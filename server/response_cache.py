@@ -0,0 +1,98 @@
+import math
+import re
+import threading
+import time
+from collections import Counter, OrderedDict, namedtuple
+
+# Words that flip a question's meaning; near-duplicates must agree on these exactly
+NEGATIONS = {"not", "no", "never", "cannot", "cant", "dont", "doesnt", "didnt", "wont", "isnt", "arent", "without"}
+# Function words that may differ between near-duplicates; every other word (including question words,
+# numbers and negations) must appear in both, so one swapped content word is never a match
+STOPWORDS = {
+    "a", "an", "the", "i", "im", "me", "my", "we", "our", "you", "your", "it", "its", "this", "that", "there",
+    "is", "am", "are", "was", "were", "be", "been", "do", "does", "did", "can", "could", "should", "would",
+    "will", "may", "might", "must", "to", "for", "of", "in", "on", "at", "by", "with", "from", "about", "and",
+    "or", "so", "as", "any", "some", "please", "hi", "hello", "hey", "thanks", "thank"
+}
+
+CacheEntry = namedtuple('CacheEntry', ['flags', 'message', 'vector', 'norm', 'guard', 'response', 'stored_at'])
+
+
+def normalize_message(message):
+    message = message.lower().replace("'", "").replace("’", "")
+    return " ".join(re.findall(r"[a-z0-9]+", message))
+
+def message_vector(normalized):
+    # Word unigrams plus bigram shingles, so word order counts for something
+    words = normalized.split()
+    vector = Counter(words)
+    vector.update(" ".join(pair) for pair in zip(words, words[1:]))
+    return vector
+
+def message_guard(normalized):
+    return frozenset(word for word in normalized.split() if word not in STOPWORDS)
+
+def cosine(a, a_norm, b, b_norm):
+    if not a_norm or not b_norm:
+        return 0.0
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(count * b.get(term, 0) for term, count in a.items()) / (a_norm * b_norm)
+
+
+class ResponseCache:
+    # Answers keyed on the normalized question plus the system-prompt flags. Exact matches hit directly;
+    # otherwise the most similar cached question with the same flags and content words hits if it clears
+    # the threshold.
+    # Everything is dropped when the padlet corpus version changes.
+    def __init__(self, max_entries=512, ttl=3600, threshold=0.9):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _check_version(self, version):
+        if version != self.version:
+            self._entries.clear()
+            self.version = version
+
+    def get(self, message, flags, version):
+        if self.max_entries <= 0:
+            return None
+        normalized = normalize_message(message)
+        now = time.time()
+        with self._lock:
+            self._check_version(version)
+            key = (flags, normalized)
+            entry = self._entries.get(key)
+            if entry is None:
+                vector = message_vector(normalized)
+                norm = math.sqrt(sum(count * count for count in vector.values()))
+                guard = message_guard(normalized)
+                best_score = self.threshold
+                for candidate_key, candidate in self._entries.items():
+                    if candidate.flags != flags or candidate.guard != guard or now - candidate.stored_at > self.ttl:
+                        continue
+                    score = cosine(vector, norm, candidate.vector, candidate.norm)
+                    if score >= best_score:
+                        key, entry, best_score = candidate_key, candidate, score
+            if entry is None or now - entry.stored_at > self.ttl:
+                return None
+            self._entries.move_to_end(key)
+            return entry.response
+
+    def put(self, message, flags, version, response):
+        if self.max_entries <= 0:
+            return
+        normalized = normalize_message(message)
+        vector = message_vector(normalized)
+        norm = math.sqrt(sum(count * count for count in vector.values()))
+        entry = CacheEntry(flags, normalized, vector, norm, message_guard(normalized), response, time.time())
+        with self._lock:
+            self._check_version(version)
+            self._entries[(flags, normalized)] = entry
+            self._entries.move_to_end((flags, normalized))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
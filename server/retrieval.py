@@ -0,0 +1,123 @@
+import math
+import re
+from collections import Counter, defaultdict, namedtuple
+
+from tokens import count_tokens
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "can", "do", "does", "for", "from",
+    "how", "i", "if", "in", "is", "it", "me", "my", "of", "on", "or", "so", "that", "the", "their",
+    "there", "this", "to", "was", "what", "when", "where", "which", "who", "will", "with", "you", "your"
+}
+
+Chunk = namedtuple('Chunk', ['position', 'title', 'text', 'tokens'])
+
+
+def tokenize(text):
+    return [word for word in WORD_RE.findall(text.lower()) if word not in STOPWORDS]
+
+def _split_long(paragraph, chunk_tokens):
+    # Break an oversized paragraph on line boundaries, then on words if a single line is still too long
+    pieces = []
+    current = []
+    size = 0
+    for line in paragraph.split("\n"):
+        words = line.split(" ")
+        if count_tokens(line) > chunk_tokens:
+            units = [" ".join(words[i:i + chunk_tokens * 3 // 4]) for i in range(0, len(words), chunk_tokens * 3 // 4)]
+        else:
+            units = [line]
+        for unit in units:
+            unit_tokens = count_tokens(unit)
+            if current and size + unit_tokens > chunk_tokens:
+                pieces.append("\n".join(current))
+                current, size = [], 0
+            current.append(unit)
+            size += unit_tokens
+    if current:
+        pieces.append("\n".join(current))
+    return pieces
+
+def chunk_documents(documents, chunk_tokens=200):
+    chunks = []
+    for title, text in documents:
+        current = []
+        size = 0
+        paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+        for paragraph in paragraphs:
+            for piece in _split_long(paragraph, chunk_tokens):
+                piece_tokens = count_tokens(piece)
+                if current and size + piece_tokens > chunk_tokens:
+                    body = "\n\n".join(current)
+                    chunks.append(Chunk(len(chunks), title, body, count_tokens(body)))
+                    current, size = [], 0
+                current.append(piece)
+                size += piece_tokens
+        if current:
+            body = "\n\n".join(current)
+            chunks.append(Chunk(len(chunks), title, body, count_tokens(body)))
+    return chunks
+
+
+class BM25Index:
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)
+        self.lengths = []
+        for chunk in chunks:
+            counts = Counter(tokenize(chunk.title + " " + chunk.text))
+            self.lengths.append(sum(counts.values()))
+            for term, freq in counts.items():
+                self.postings[term].append((chunk.position, freq))
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0
+        total = len(chunks)
+        self.idf = {
+            term: math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+    def search(self, query, top_k=5):
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for position, freq in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[position] / self.avg_length)
+                scores[position] += idf * freq * (self.k1 + 1) / (freq + norm)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(self.chunks[position], score) for position, score in ranked[:top_k]]
+
+
+def build_index(documents, chunk_tokens=200):
+    return BM25Index(chunk_documents(documents, chunk_tokens))
+
+def format_chunks(chunks):
+    # Keep corpus order and group consecutive chunks under their document heading
+    parts = []
+    last_title = None
+    for chunk in sorted(chunks, key=lambda c: c.position):
+        if chunk.title != last_title:
+            parts.append(f"\n--- {chunk.title} ---\n")
+            last_title = chunk.title
+        parts.append(chunk.text + "\n")
+    return "".join(parts)
+
+def select_context(index, query, top_k=6, token_budget=1500):
+    selected = []
+    used = 0
+    candidates = [chunk for chunk, _ in index.search(query, top_k)]
+    if not candidates:
+        # Nothing matched (greetings, vague questions): fall back to the start of the corpus
+        candidates = index.chunks
+    for chunk in candidates:
+        if used + chunk.tokens > token_budget:
+            continue
+        selected.append(chunk)
+        used += chunk.tokens
+        if len(selected) >= top_k:
+            break
+    return format_chunks(selected)
@@ -0,0 +1,47 @@
+import pytest
+
+from history import compact_history
+from tokens import message_tokens
+
+
+def conversation(count):
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i} " + "word " * 20}
+        for i in range(count)
+    ]
+
+
+def summarize(block):
+    return "a summary"
+
+
+MESSAGES = conversation(20)
+SIZE = message_tokens(MESSAGES[0])
+SUMMARY_SIZE = message_tokens({"role": "system", "content": "Summary of an earlier part of this conversation: a summary"})
+
+
+@pytest.mark.parametrize("budget, summarize_with, expected_kept, expected_summaries", [
+    # Everything fits
+    (SIZE * 25, None, 20, 0),
+    # The recent window alone is over budget: it is trimmed from the front
+    (SIZE * 3, None, 3, 0),
+    # Even the last message alone is over budget: it is still kept
+    (1, None, 1, 0),
+    (1, summarize, 1, 0),
+    # Room for the recent window and one summary block, not both blocks
+    (SIZE * 6 + SUMMARY_SIZE, summarize, 6, 1),
+    # The window fills the budget exactly, so no summary block fits
+    (SIZE * 6, summarize, 6, 0),
+])
+def test_compact_history_budget_edges(budget, summarize_with, expected_kept, expected_summaries):
+    compacted, info = compact_history(MESSAGES, budget, keep_messages=6, summarize=summarize_with, summary_block=8)
+    summaries = [m for m in compacted if m["role"] == "system"]
+    kept = compacted[len(summaries):]
+
+    assert len(summaries) == expected_summaries
+    assert kept == MESSAGES[len(MESSAGES) - expected_kept:]
+    # The latest message is never dropped
+    assert compacted[-1] is MESSAGES[-1]
+    assert info['history_messages_dropped'] + info['history_messages_summarized'] + len(kept) == len(MESSAGES)
+    if expected_kept > 1:
+        assert info['history_tokens'] <= budget
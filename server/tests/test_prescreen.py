@@ -0,0 +1,51 @@
+import pytest
+
+from prescreen import is_benign
+
+# Must always reach the remote classifier
+NOT_BENIGN = [
+    "I want to hang myself",
+    "I don't want to live anymore",
+    "I am going to take all my meds tonight",
+    "everyone would be better off without me",
+    "I want to stab my lecturer",
+    "I want to kill myself",
+    "How do I kill myself?",
+    "How many pills would it take?",
+    "What is the tallest building on campus? I want to jump",
+    "Where is the nearest bridge?",
+    "Can I end it all?",
+    "Will anyone miss me if I am gone?",
+    "I can't do this anymore",
+    "hi, I feel like disappearing",
+    "Nobody would notice if I was gone",
+    "What happens if I stop taking my medication?",
+    "Is it painless to overdose?",
+    "thanks for everything, goodbye forever",
+    "How do I apply for the SEN fund? Also I want to die",
+]
+
+BENIGN = [
+    "hi",
+    "Hello!",
+    "Thank you so much",
+    "How do I apply for the SEN fund?",
+    "Where is the SNS office located?",
+    "When is the deadline for the bursary application?",
+    "Can I get extra time for exams?",
+    "hi, what documents are needed for the special needs application?",
+]
+
+
+@pytest.mark.parametrize("message", NOT_BENIGN)
+def test_risky_messages_are_never_prescreened(message):
+    assert not is_benign(message)
+
+
+@pytest.mark.parametrize("message", BENIGN)
+def test_greetings_and_logistics_questions_are_prescreened(message):
+    assert is_benign(message)
+
+
+def test_long_messages_go_to_the_classifier():
+    assert not is_benign("How do I apply for the SEN fund " + "and the bursary " * 20 + "?", max_words=40)
@@ -0,0 +1,24 @@
+import pytest
+
+from redaction import Redactor
+
+TEXTS = [
+    "Please contact Liew Tian En at liew.te@example.com or 91234567.",
+    "John Tan's number is 61234567, Marcus Lee's is 87654321.",
+    "Email nyp_sns@nyp.edu.sg or ask Sasha (Age: 21) about it.",
+    "Al said 12345678901 was Ng Su Li's number\nand Kah Wee agreed.",
+]
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_stream_matches_redact_for_every_split(text):
+    redactor = Redactor()
+    expected = redactor.redact(text)
+    for offset in range(len(text) + 1):
+        assert "".join(redactor.stream([text[:offset], text[offset:]])) == expected
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_stream_matches_redact_one_character_at_a_time(text):
+    redactor = Redactor()
+    assert "".join(redactor.stream(text)) == redactor.redact(text)
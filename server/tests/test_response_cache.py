@@ -0,0 +1,47 @@
+import pytest
+
+from response_cache import ResponseCache
+
+FLAGS = ('safe', None, False, False)
+VERSION = 'v1'
+
+# (cached question, new question) pairs that ask something different and must not share an answer
+NEAR_MISSES = [
+    ("How do I apply for the SEN fund?", "How do I apply for the SEN counsellor?"),
+    ("What should I do if I am absent from class for a medical appointment?",
+     "What should I do if I am absent from class for a family funeral?"),
+    ("What should I do if I am absent from class for a medical appointment?",
+     "What should I do if I am late for class for a medical appointment?"),
+    ("Where is the SNS office?", "When is the SNS office open?"),
+    ("Can I get extra time for exams?", "Can I not get extra time for exams?"),
+    ("How many days of leave can I take in semester 1?", "How many days of leave can I take in semester 2?"),
+]
+
+# Rephrasings that only differ in function words or punctuation
+NEAR_DUPLICATES = [
+    ("How do I apply for the SEN fund?", "how do i apply for the SEN fund"),
+    ("How do I apply for the SEN fund?", "How do I apply for the SEN fund please?"),
+    ("Where is the SNS office?", "Hi, where is the SNS office?"),
+]
+
+
+def cache_with(question):
+    cache = ResponseCache()
+    cache.put(question, FLAGS, VERSION, "cached answer")
+    return cache
+
+
+@pytest.mark.parametrize("cached, asked", NEAR_MISSES)
+def test_different_questions_miss(cached, asked):
+    assert cache_with(cached).get(asked, FLAGS, VERSION) is None
+
+
+@pytest.mark.parametrize("cached, asked", NEAR_DUPLICATES)
+def test_rephrased_questions_hit(cached, asked):
+    assert cache_with(cached).get(asked, FLAGS, VERSION) == "cached answer"
+
+
+def test_flags_and_corpus_version_must_match():
+    cache = cache_with("How do I apply for the SEN fund?")
+    assert cache.get("How do I apply for the SEN fund?", ('harmful', None, False, False), VERSION) is None
+    assert cache.get("How do I apply for the SEN fund?", FLAGS, 'v2') is None
@@ -0,0 +1,86 @@
+import pytest
+
+import upstream
+from upstream import CircuitBreaker
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(upstream.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def opened_breaker(clock, threshold=3, reset_after=30):
+    breaker = CircuitBreaker(failure_threshold=threshold, reset_after=reset_after)
+    for _ in range(threshold):
+        assert breaker.allow()
+        breaker.record_failure()
+    return breaker
+
+
+def test_opens_after_threshold_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_after=30)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == 'closed' and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+
+
+def test_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_after=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+
+
+def test_allows_exactly_one_trial_once_half_open(clock):
+    breaker = opened_breaker(clock)
+    clock[0] += 29
+    assert not breaker.allow()
+    clock[0] += 1
+    assert breaker.state == 'half-open'
+    assert breaker.allow()
+    assert not breaker.allow()
+    assert not breaker.allow()
+
+
+def test_trial_success_closes(clock):
+    breaker = opened_breaker(clock)
+    clock[0] += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    assert breaker.allow() and breaker.allow()
+
+
+def test_trial_failure_reopens(clock):
+    breaker = opened_breaker(clock)
+    clock[0] += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+    clock[0] += 30
+    assert breaker.allow()
+
+
+def test_abandon_releases_the_trial(clock):
+    breaker = opened_breaker(clock)
+    clock[0] += 30
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.abandon()
+    assert breaker.state == 'half-open'
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_abandon_while_closed_is_harmless(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_after=30)
+    breaker.abandon()
+    assert breaker.state == 'closed' and breaker.allow()
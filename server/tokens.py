@@ -0,0 +1,29 @@
+import logging
+from functools import lru_cache
+
+logger = logging.getLogger('chatbot.tokens')
+
+
+@lru_cache(maxsize=1)
+def encoding():
+    # Loaded on first use: cl100k_base is the gpt-3.5-turbo encoding, and loading it may need a one-off download
+    try:
+        import tiktoken
+        return tiktoken.get_encoding('cl100k_base')
+    except Exception as e:
+        logger.warning("tiktoken unavailable (%s); falling back to approximate token counts", e)
+        return None
+
+# Per-message overhead of the chat format (role and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def count_tokens(text):
+    enc = encoding()
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    # Rough OpenAI token estimate (~4 characters per token)
+    return max(1, len(text) // 4)
+
+def message_tokens(message):
+    return count_tokens(message.get('content') or '') + MESSAGE_OVERHEAD_TOKENS
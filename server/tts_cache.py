@@ -0,0 +1,85 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+
+
+def split_sentences(text, min_chars=40, max_chars=4000):
+    # Sentence-sized pieces for incremental TTS; tiny fragments are merged to save round trips
+    pieces = []
+    for part in re.split(r"(?<=[.!?])\s+|\n+", text):
+        part = part.strip()
+        while len(part) > max_chars:
+            cut = part.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            pieces.append(part[:cut])
+            part = part[cut:].strip()
+        if not part:
+            continue
+        if pieces and len(pieces[-1]) < min_chars and len(pieces[-1]) + len(part) + 1 <= max_chars:
+            pieces[-1] = pieces[-1] + " " + part
+        else:
+            pieces.append(part)
+    return pieces
+
+
+class AudioCache:
+    # Content-addressed synthesized audio on disk; least recently used files go first once over max_bytes
+    def __init__(self, cache_dir, max_bytes=256 * 1024 * 1024):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = sum(entry.stat().st_size for entry in os.scandir(cache_dir) if entry.name.endswith('.mp3'))
+
+    @staticmethod
+    def key(text, voice, model):
+        return hashlib.sha256(f"{model}\0{voice}\0{text}".encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + '.mp3')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # mtime doubles as the last-used time for eviction
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        path = self._path(key)
+        with self._lock:
+            # Overwriting an entry replaces its bytes rather than adding to them
+            try:
+                self._size -= os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+            os.replace(temp_path, path)
+            self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(
+            (entry.stat().st_mtime, entry.stat().st_size, entry.path)
+            for entry in os.scandir(self.cache_dir) if entry.name.endswith('.mp3')
+        )
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self._size <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+                self._size -= size
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,273 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+import weakref
+
+import openai
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+from metrics import UPSTREAM_REQUESTS, UPSTREAM_SECONDS, record_tokens
+
+try:
+    import httpx
+except ImportError:
+    # Newer openai releases are built on httpx2, which keeps the same API
+    import httpx2 as httpx
+
+logger = logging.getLogger('chatbot.upstream')
+
+# Worth another attempt: network trouble, timeouts, rate limits and 5xx responses
+TRANSIENT_ERRORS = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+
+class UpstreamUnavailable(Exception):
+    # The call was not made (breaker open, too many in flight) or kept failing transiently
+    pass
+
+
+def pool_exhausted(error):
+    # The SDK reports a local connection-pool wait as a timeout; nothing was sent, so upstream is not at fault
+    return isinstance(error.__cause__, httpx.PoolTimeout)
+
+
+def pool_limits(max_connections, keepalive_expiry):
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections,
+        keepalive_expiry=keepalive_expiry
+    )
+
+def pooled_client(api_key, max_connections=32, keepalive_expiry=30):
+    # One keep-alive pool for every call; retries are done by Upstream, not the SDK. Size it to at least
+    # Upstream's max_concurrency: every call, streams included, holds a slot while it uses a connection
+    return OpenAI(
+        api_key=api_key,
+        max_retries=0,
+        http_client=DefaultHttpxClient(limits=pool_limits(max_connections, keepalive_expiry))
+    )
+
+def pooled_async_client(api_key, max_connections=256, keepalive_expiry=30):
+    return AsyncOpenAI(
+        api_key=api_key,
+        max_retries=0,
+        http_client=DefaultAsyncHttpxClient(limits=pool_limits(max_connections, keepalive_expiry))
+    )
+
+
+class CircuitBreaker:
+    # Opens after `failure_threshold` consecutive transient failures and rejects calls for `reset_after`
+    # seconds; then a single trial call is let through and its outcome closes or re-opens the circuit
+    def __init__(self, failure_threshold=5, reset_after=30):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half-open' if time.monotonic() - self.opened_at >= self.reset_after else 'open'
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._trial or time.monotonic() - self.opened_at < self.reset_after:
+                return False
+            self._trial = True
+            return True
+
+    def abandon(self):
+        # A trial call ended without an outcome (it was cancelled); the next call may try instead
+        with self._lock:
+            if self.opened_at is not None:
+                self._trial = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self._trial:
+                    logger.warning("Circuit opened after %d consecutive upstream failures", self.failures)
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+
+class HeldStream:
+    # A streamed completion keeps its pooled connection until it ends, so it keeps its Upstream slot too.
+    # Both are given back when the stream is read to the end, closed, or dropped and garbage collected.
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = weakref.finalize(self, self._cleanup, stream, release)
+
+    @staticmethod
+    def _cleanup(stream, release):
+        try:
+            stream.close()
+        finally:
+            release()
+
+    def __iter__(self):
+        for chunk in self._stream:
+            yield chunk
+        self.close()
+
+    def close(self):
+        self._release()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class AsyncHeldStream(HeldStream):
+    @staticmethod
+    def _cleanup(stream, release):
+        # A dropped async stream cannot be awaited here; its connection goes back when it is collected
+        release()
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+        await self.close()
+
+    async def close(self):
+        try:
+            await self._stream.close()
+        finally:
+            self._release()
+
+
+class Upstream:
+    # Every OpenAI call goes through here: at most `max_concurrency` in flight (waiting up to
+    # `queue_timeout` for a slot), a per-endpoint timeout, jittered exponential retries on transient
+    # errors and a shared circuit breaker. A streamed call holds its slot until the stream ends, but
+    # only its start is retried and counted by the breaker.
+    def __init__(self, client, timeouts, max_concurrency=32, queue_timeout=10, retries=2, backoff=0.5,
+                 max_backoff=8, breaker=None):
+        self.client = client
+        self.timeouts = timeouts
+        self.queue_timeout = queue_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+    def call(self, endpoint, create, **kwargs):
+        kwargs.setdefault('timeout', self.timeouts.get(endpoint))
+        for attempt in range(self.retries + 1):
+            # Take a slot before asking the breaker, so an allowed trial call is always made
+            if not self._slots.acquire(timeout=self.queue_timeout):
+                self._rejected(endpoint, 'busy')
+            if not self.breaker.allow():
+                self._slots.release()
+                self._rejected(endpoint, 'circuit_open')
+            started = time.perf_counter()
+            held = False
+            try:
+                result = create(**kwargs)
+            except TRANSIENT_ERRORS as e:
+                self._failed(endpoint, attempt, e, started)
+            except Exception:
+                # The request itself is wrong (bad input, auth); upstream is healthy
+                self._finished(endpoint, 'error', started)
+                raise
+            else:
+                self._finished(endpoint, 'ok', started, result)
+                if kwargs.get('stream'):
+                    held = True
+                    return HeldStream(result, self._slots.release)
+                return result
+            finally:
+                if not held:
+                    self._slots.release()
+            time.sleep(self._delay(attempt))
+
+    def _rejected(self, endpoint, outcome):
+        UPSTREAM_REQUESTS.inc(endpoint=endpoint, outcome=outcome)
+        reason = "circuit open" if outcome == 'circuit_open' else "too many upstream calls in flight"
+        raise UpstreamUnavailable(f"{endpoint}: {reason}")
+
+    def _finished(self, endpoint, outcome, started, result=None):
+        self.breaker.record_success()
+        UPSTREAM_REQUESTS.inc(endpoint=endpoint, outcome=outcome)
+        UPSTREAM_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+        # Streams report usage in their last chunk; the caller records that
+        record_tokens(endpoint, getattr(result, 'usage', None))
+
+    def _failed(self, endpoint, attempt, error, started):
+        if pool_exhausted(error):
+            # Our own connections are all busy: shed the call like a full queue, without blaming upstream
+            self.breaker.abandon()
+            self._rejected(endpoint, 'busy')
+        self.breaker.record_failure()
+        UPSTREAM_REQUESTS.inc(endpoint=endpoint, outcome='transient')
+        UPSTREAM_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+        logger.warning("%s attempt %d failed: %s", endpoint, attempt + 1, error)
+        if attempt == self.retries:
+            raise UpstreamUnavailable(f"{endpoint}: {error}") from error
+
+    def _delay(self, attempt):
+        # Full jitter keeps retrying workers from hitting the API in lockstep
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def chat(self, endpoint='chat', **kwargs):
+        return self.call(endpoint, self.client.chat.completions.create, **kwargs)
+
+    def transcribe(self, **kwargs):
+        return self.call('transcribe', self.client.audio.transcriptions.create, **kwargs)
+
+    def speech(self, **kwargs):
+        return self.call('speech', self.client.audio.speech.create, **kwargs)
+
+
+class AsyncUpstream(Upstream):
+    # The same policy around an AsyncOpenAI client; calls are coroutines and wait on an asyncio semaphore.
+    # Pass the sync gateway's breaker to share one view of upstream health.
+    def __init__(self, client, timeouts, max_concurrency=256, **kwargs):
+        super().__init__(client, timeouts, max_concurrency, **kwargs)
+        self._slots = asyncio.BoundedSemaphore(max_concurrency)
+
+    async def call(self, endpoint, create, **kwargs):
+        kwargs.setdefault('timeout', self.timeouts.get(endpoint))
+        for attempt in range(self.retries + 1):
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._rejected(endpoint, 'busy')
+            if not self.breaker.allow():
+                self._slots.release()
+                self._rejected(endpoint, 'circuit_open')
+            started = time.perf_counter()
+            held = False
+            try:
+                result = await create(**kwargs)
+            except asyncio.CancelledError:
+                # Typically the client went away
+                self.breaker.abandon()
+                raise
+            except TRANSIENT_ERRORS as e:
+                self._failed(endpoint, attempt, e, started)
+            except Exception:
+                self._finished(endpoint, 'error', started)
+                raise
+            else:
+                self._finished(endpoint, 'ok', started, result)
+                if kwargs.get('stream'):
+                    held = True
+                    return AsyncHeldStream(result, self._slots.release)
+                return result
+            finally:
+                if not held:
+                    self._slots.release()
+            await asyncio.sleep(self._delay(attempt))